@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                      ShoppingCart, Subscribe, Tag, TagRecipe)
+from .search import index_recipes
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -15,9 +16,13 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("name", "author", "count_favorites")
+    list_display = ("name", "author", "favorites_count")
     list_filter = ["name", "author", "tags"]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        index_recipes([form.instance.pk])
+
 
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
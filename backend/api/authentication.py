@@ -0,0 +1,115 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LRUCache:
+    """A bounded, thread-safe mapping whose entries expire."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = LRUCache(settings.TOKEN_CACHE_SIZE)
+
+
+def get_shared_cache():
+    if settings.TOKEN_CACHE is None:
+        return None
+    return caches[settings.TOKEN_CACHE]
+
+
+def token_key(key):
+    return "auth:token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def forget_token(key):
+    cache_key = token_key(key)
+    local_tokens.delete(cache_key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(cache_key)
+
+
+def invalidate_token(key):
+    """Forget a token in this process and in the shared tier.
+
+    It is forgotten again on commit, so a request reading the old rows in
+    the meantime cannot cache them. Other processes drop their copy
+    within ``TOKEN_CACHE_LOCAL_TTL``.
+    """
+    forget_token(key)
+    transaction.on_commit(lambda: forget_token(key))
+
+
+def invalidate_user_tokens(user):
+    for key in Token.objects.filter(user=user).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication without the Token/User query on every request.
+
+    The token with its user is kept in a per-process LRU for
+    ``TOKEN_CACHE_LOCAL_TTL`` seconds and, when ``TOKEN_CACHE`` names a
+    cache, in that shared cache for ``TOKEN_CACHE_TTL`` seconds. Signals
+    drop the entries on logout, password change and deactivation.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        # Tokens are stored pickled, every request gets its own instances.
+        data = local_tokens.get(cache_key)
+        shared = get_shared_cache()
+        if data is None and shared is not None:
+            data = shared.get(cache_key)
+            if data is not None:
+                local_tokens.set(
+                    cache_key, data, settings.TOKEN_CACHE_LOCAL_TTL
+                )
+        if data is None:
+            user, token = super().authenticate_credentials(key)
+            data = pickle.dumps(token)
+            local_tokens.set(cache_key, data, settings.TOKEN_CACHE_LOCAL_TTL)
+            if shared is not None:
+                shared.set(cache_key, data, settings.TOKEN_CACHE_TTL)
+            return user, token
+        token = pickle.loads(data)
+        return token.user, token
@@ -0,0 +1,82 @@
+import threading
+from bisect import bisect_left
+
+from .cache import get_version
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """In-memory index of ingredient names for autocomplete.
+
+    Names are kept in a sorted array for prefix lookups and every suffix of
+    every name in a second sorted array, so substring lookups are a binary
+    search as well. Matching is case-insensitive: prefix hits come first,
+    then substring hits, both in alphabetical order.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda item: (item.name.casefold(), item.pk)
+        )
+        self.names = [item.name.casefold() for item in self.ingredients]
+        suffixes = sorted(
+            (name[start:], position)
+            for position, name in enumerate(self.names)
+            for start in range(1, len(name))
+        )
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.positions = [position for _, position in suffixes]
+
+    def all(self):
+        return self.ingredients
+
+    def search(self, query, limit):
+        query = query.casefold()
+        if not query:
+            return []
+
+        result = []
+        position = bisect_left(self.names, query)
+        while (
+            len(result) < limit
+            and position < len(self.names)
+            and self.names[position].startswith(query)
+        ):
+            result.append(position)
+            position += 1
+
+        if len(result) < limit:
+            substring_hits = set()
+            suffixes = self.suffixes
+            index = bisect_left(suffixes, query)
+            while index < len(suffixes) and suffixes[index].startswith(query):
+                substring_hits.add(self.positions[index])
+                index += 1
+            substring_hits = sorted(substring_hits.difference(result))
+            result.extend(substring_hits[: limit - len(result)])
+
+        return [self.ingredients[position] for position in result]
+
+
+_index = None
+_version = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Return the index, rebuilding it when the ingredient table changed."""
+    global _index, _version
+    version = get_version(Ingredient)
+    index = _index
+    if index is None or _version != version:
+        with _lock:
+            if _index is None or _version != version:
+                _index = IngredientIndex(Ingredient.objects.all())
+                _version = version
+            index = _index
+    return index
+
+
+def reset_index():
+    global _index
+    _index = None
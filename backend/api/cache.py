@@ -0,0 +1,172 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+from rest_framework.renderers import JSONRenderer
+
+HITS_KEY = "catalog:stats:hits"
+MISSES_KEY = "catalog:stats:misses"
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def version_key(model, scope=None):
+    key = f"catalog:{model._meta.label_lower}:version"
+    if scope is not None:
+        key = f"{key}:{scope}"
+    return key
+
+
+def get_version(model, scope=None):
+    """Return the current cache generation of a model's table.
+
+    The generation is a nanosecond timestamp of the last change, stored in
+    the cache itself so every worker sharing the backend sees a bump. If
+    the key was evicted it is started again from the clock, which never
+    matches an older generation. ``scope`` narrows the generation down,
+    e.g. to the rows of a single user.
+    """
+    cache = get_cache()
+    key = version_key(model, scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(model, scope=None):
+    cache = get_cache()
+    key = version_key(model, scope)
+    version = max(time.time_ns(), cache.get(key, 0) + 1)
+    cache.set(key, version, timeout=None)
+
+
+def invalidate(model, scope=None):
+    """Bump a generation now and once more when the transaction commits.
+
+    The second bump keeps readers from caching data they read under the
+    new generation before the change became visible to them.
+    """
+    bump_version(model, scope)
+    transaction.on_commit(lambda: bump_version(model, scope))
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+class CatalogCacheMixin:
+    """Caches rendered JSON of read-only catalog endpoints.
+
+    Entries are keyed by the model's table generation and the query string,
+    so a bump of the generation on save or delete invalidates all of them
+    at once. Requests asking for anything but JSON skip the cache.
+    """
+
+    cache_model = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request):
+        query = "&".join(
+            f"{name}={value}"
+            for name, values in sorted(request.query_params.lists())
+            for value in values
+        )
+        return (
+            f"catalog:{self.cache_model._meta.label_lower}:"
+            f"{get_version(self.cache_model)}:{request.path}?{query}"
+        )
+
+    def cached(self, handler, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        content = cache.get(key)
+        if content is None:
+            count(MISSES_KEY)
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = request.accepted_renderer.render(response.data)
+            cache.set(key, content, settings.CATALOG_CACHE_TIMEOUT)
+            status = "MISS"
+        else:
+            count(HITS_KEY)
+            status = "HIT"
+        response = HttpResponse(content, content_type="application/json")
+        response["X-Cache"] = status
+        return response
+
+
+class ConditionalGetMixin:
+    """Answers conditional GETs with 304 before the view does any work.
+
+    ETag and Last-Modified are derived from the generations of
+    ``etag_models`` and, for authenticated users, of ``user_models``
+    scoped to the requesting user. The user id is part of the ETag so
+    per-user representations never validate for someone else. Only the
+    ETag validates: Last-Modified has whole seconds, so If-Modified-Since
+    would answer 304 to changes made later in the same second.
+    """
+
+    etag_models = ()
+    user_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def get_versions(self, request):
+        versions = [get_version(model) for model in self.etag_models]
+        if request.user.is_authenticated:
+            versions.extend(
+                get_version(model, request.user.pk)
+                for model in self.user_models
+            )
+        return versions
+
+    def conditional(self, handler, request, *args, **kwargs):
+        versions = self.get_versions(request)
+        etag = hashlib.md5(
+            f"{request.user.pk}:{request.accepted_renderer.format}:"
+            f"{request.get_full_path()}:{versions}".encode()
+        ).hexdigest()
+
+        @condition(etag_func=lambda *args, **kwargs: etag)
+        def view(request, *args, **kwargs):
+            return handler(request, *args, **kwargs)
+
+        response = view(request, *args, **kwargs)
+        response["Last-Modified"] = http_date(max(versions) / 10 ** 9)
+        patch_vary_headers(response, ["Authorization"])
+        return response
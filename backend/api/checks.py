@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register("caches", deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    """Cache generations, the pantry journal and token revocations live in
+    the cache, so every worker process has to see the same one.
+    """
+    aliases = {settings.CATALOG_CACHE, settings.TOKEN_CACHE} - {None}
+    return [
+        Error(
+            f"The {alias!r} cache is local to each process.",
+            hint="Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, "
+            "e.g. memcached.",
+            id="api.E001",
+        )
+        for alias in sorted(aliases)
+        if settings.CACHES[alias]["BACKEND"] in LOCAL_BACKENDS
+    ]
@@ -0,0 +1,42 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import User
+
+from .models import Favorite, Recipe, Subscribe
+
+# (model, counter field, counted model, foreign key of the counted model)
+COUNTERS = [
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Subscribe, "following"),
+]
+
+
+def change(model, pk, field, delta):
+    """Atomically add ``delta`` to a counter without reading the row."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(counted_model, foreign_key):
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(**{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def update_counters(sender, instance, delta):
+    for model, field, counted_model, foreign_key in COUNTERS:
+        if counted_model is sender:
+            pk = getattr(instance, f"{foreign_key}_id")
+            if pk is not None:
+                change(model, pk, field, delta)
@@ -0,0 +1,137 @@
+import logging
+import os
+import random
+import re
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN = {
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+PLACEHOLDERS = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+SITE_PACKAGES = f"{os.sep}site-packages{os.sep}"
+
+
+def fingerprint(sql):
+    """The shape of a query: ``IN (%s, %s)`` and ``IN (%s)`` are equal."""
+    return PLACEHOLDERS.sub("(...)", sql)
+
+
+def project_stack():
+    """Frames of our own code, innermost last, without this module."""
+    return [
+        frame
+        for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(settings.BASE_DIR)
+        and SITE_PACKAGES not in frame.filename
+        and frame.filename != __file__
+    ]
+
+
+def format_stack(stack):
+    return "\n".join(
+        f"  {os.path.relpath(frame.filename, settings.BASE_DIR)}:"
+        f"{frame.lineno} in {frame.name}: {frame.line}"
+        for frame in stack
+    )
+
+
+class QueryCollector:
+    """``execute_wrapper`` grouping the queries of a request by shape."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.counts = {}
+        self.repeated = {}
+        self.slow = []
+        self.repeat_threshold = settings.QUERY_DIAGNOSTICS_REPEAT_THRESHOLD
+        self.slow_seconds = settings.QUERY_DIAGNOSTICS_SLOW_MS / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            shape = fingerprint(sql)
+            count = self.counts.get(shape, 0) + 1
+            self.counts[shape] = count
+            if count == self.repeat_threshold:
+                self.repeated[shape] = project_stack()
+            if duration >= self.slow_seconds and not many:
+                self.slow.append((sql, params, duration))
+
+    def explain(self, sql, params):
+        connection = connections[self.alias]
+        prefix = EXPLAIN.get(connection.vendor)
+        if prefix is None or not sql.lstrip().upper().startswith("SELECT"):
+            return ""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return "\n".join(
+                    "  " + " ".join(str(column) for column in row)
+                    for row in cursor.fetchall()
+                )
+        except Exception as error:
+            return f"  EXPLAIN failed: {error}"
+
+    def report(self, request):
+        path = request.get_full_path()
+        for shape, stack in self.repeated.items():
+            logger.warning(
+                "%s %s: query repeated %d times, likely N+1:\n  %s\n%s",
+                request.method,
+                path,
+                self.counts[shape],
+                shape,
+                format_stack(stack),
+            )
+        for sql, params, duration in self.slow:
+            logger.warning(
+                "%s %s: slow query (%.1f ms):\n  %s\n%s",
+                request.method,
+                path,
+                duration * 1000,
+                sql,
+                self.explain(sql, params),
+            )
+
+
+class QueryDiagnosticsMiddleware:
+    """Flags N+1 patterns and slow queries in a sample of requests.
+
+    Enabled by ``QUERY_DIAGNOSTICS``; only ``QUERY_DIAGNOSTICS_SAMPLE_RATE``
+    of the requests are inspected, the rest pay for a single random()
+    call. A query shape seen ``QUERY_DIAGNOSTICS_REPEAT_THRESHOLD`` times
+    in one request is logged with the stack of our code that ran it, and
+    queries slower than ``QUERY_DIAGNOSTICS_SLOW_MS`` with their plan.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            not settings.QUERY_DIAGNOSTICS
+            or random.random() >= settings.QUERY_DIAGNOSTICS_SAMPLE_RATE
+        ):
+            return self.get_response(request)
+
+        collectors = []
+        with ExitStack() as stack:
+            for connection in connections.all():
+                collector = QueryCollector(connection.alias)
+                collectors.append(collector)
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        for collector in collectors:
+            collector.report(request)
+        return response
@@ -0,0 +1,95 @@
+import factory
+from django.contrib.auth.hashers import make_password
+from factory.django import DjangoModelFactory
+
+from users.models import User
+
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Subscribe, Tag, TagRecipe)
+from .search import index_recipes
+
+
+class UserFactory(DjangoModelFactory):
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda number: f"user{number}")
+    email = factory.LazyAttribute(lambda user: f"{user.username}@foodgram.ru")
+    first_name = "First"
+    last_name = "Last"
+    password = factory.LazyFunction(lambda: make_password(None))
+
+
+class TagFactory(DjangoModelFactory):
+    class Meta:
+        model = Tag
+
+    name = factory.Sequence(lambda number: f"tag {number}")
+    color = factory.Sequence(lambda number: f"#{number:06x}")
+    slug = factory.Sequence(lambda number: f"tag-{number}")
+
+
+class IngredientFactory(DjangoModelFactory):
+    class Meta:
+        model = Ingredient
+
+    name = factory.Sequence(lambda number: f"ingredient {number}")
+    measurement_unit = "g"
+
+
+class RecipeFactory(DjangoModelFactory):
+    """A recipe, ``tags`` and ``ingredients`` may be passed as lists."""
+
+    class Meta:
+        model = Recipe
+        skip_postgeneration_save = True
+
+    author = factory.SubFactory(UserFactory)
+    name = factory.Sequence(lambda number: f"recipe {number}")
+    image = "recipes/recipe.jpg"
+    text = "text"
+    cooking_time = 10
+
+    @factory.post_generation
+    def tags(self, create, tags, **kwargs):
+        if create and tags:
+            TagRecipe.objects.bulk_create(
+                TagRecipe(tag=tag, recipe=self) for tag in tags
+            )
+
+    @factory.post_generation
+    def ingredients(self, create, ingredients, **kwargs):
+        if create and ingredients:
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(ingredient=ingredient, recipe=self, amount=1)
+                for ingredient in ingredients
+            )
+
+    @factory.post_generation
+    def search_index(self, create, extracted, **kwargs):
+        if create:
+            index_recipes([self.pk])
+
+
+class FavoriteFactory(DjangoModelFactory):
+    class Meta:
+        model = Favorite
+
+    user = factory.SubFactory(UserFactory)
+    recipe = factory.SubFactory(RecipeFactory)
+
+
+class ShoppingCartFactory(DjangoModelFactory):
+    class Meta:
+        model = ShoppingCart
+
+    user = factory.SubFactory(UserFactory)
+    recipe = factory.SubFactory(RecipeFactory)
+
+
+class SubscribeFactory(DjangoModelFactory):
+    class Meta:
+        model = Subscribe
+
+    user = factory.SubFactory(UserFactory)
+    following = factory.SubFactory(UserFactory)
@@ -0,0 +1,53 @@
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Tag, TagRecipe
+
+TAG_MODES = ("any", "all")
+
+
+def has_tags(slugs):
+    return Exists(
+        TagRecipe.objects.filter(recipe=OuterRef("pk"), tag__slug__in=slugs)
+    )
+
+
+def filter_by_tags(queryset, slugs, mode="any"):
+    """Recipes having any or all of the tags, as EXISTS semi-joins.
+
+    Unlike a join to the tags, a semi-join never multiplies the recipe
+    rows, so no DISTINCT over them is needed.
+    """
+    if mode not in TAG_MODES:
+        raise ValidationError(
+            {"tags_mode": f"Expected one of: {', '.join(TAG_MODES)}"}
+        )
+    if mode == "any":
+        return queryset.filter(has_tags(slugs))
+    for slug in set(slugs):
+        queryset = queryset.filter(has_tags([slug]))
+    return queryset
+
+
+def tag_facets(queryset):
+    """Every tag with the number of recipes of ``queryset`` having it."""
+    recipes = queryset.order_by().values("pk")
+    return (
+        Tag.objects.annotate(
+            count=Coalesce(
+                Subquery(
+                    TagRecipe.objects.filter(
+                        tag=OuterRef("pk"), recipe__in=recipes
+                    )
+                    .order_by()
+                    .values("tag")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0,
+            )
+        )
+        .order_by("id")
+        .values("id", "name", "slug", "count")
+    )
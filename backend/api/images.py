@@ -0,0 +1,153 @@
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+MAX_SIZE = (1600, 1600)
+VARIANTS = {
+    "small": (320, 320),
+    "medium": (800, 800),
+}
+FORMATS = {
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 90, "optimize": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 90},
+}
+# The first extension is the one given to files converted to the format.
+EXTENSIONS = {
+    "JPEG": (".jpg", ".jpeg"),
+    "PNG": (".png",),
+    "WEBP": (".webp",),
+}
+
+
+def reencode(source):
+    """Re-encode an uploaded image, capped at MAX_SIZE.
+
+    Only pixels are copied over, so EXIF (including GPS), comments and
+    other metadata of the upload are dropped. The EXIF orientation is
+    applied so the result is not rotated. Formats without SAVE_OPTIONS
+    become PNG. Returns the content and its format.
+    """
+    with Image.open(source) as image:
+        image_format = image.format if image.format in SAVE_OPTIONS else "PNG"
+        # thumbnail() lets JPEG decode at a reduced scale, so the full size
+        # image is never transposed. MAX_SIZE is square, the bound is the
+        # same either way round.
+        image.thumbnail(MAX_SIZE)
+        image = ImageOps.exif_transpose(image)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **SAVE_OPTIONS[image_format])
+    return buffer.getvalue(), image_format
+
+
+def output_name(name, image_format):
+    """``name`` with an extension of ``image_format``."""
+    stem, extension = posixpath.splitext(name)
+    extensions = EXTENSIONS[image_format]
+    if extension.lower() in extensions:
+        return name
+    return stem + extensions[0]
+
+
+def sanitize(upload):
+    content, image_format = reencode(upload)
+    return ContentFile(content, name=output_name(upload.name, image_format))
+
+
+def variant_name(name, variant, extension):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory, "variants", f"{stem}.{variant}.{extension}"
+    )
+
+
+def variant_names(name):
+    return {
+        variant: {
+            extension: variant_name(name, variant, extension)
+            for extension in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+def overwrite(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def generate_variants(name, force=False):
+    """Write every resized variant of a stored image next to it.
+
+    Content-addressed originals never change, so variants that already
+    exist are kept unless ``force`` is set.
+    """
+    variants = [
+        variant
+        for extensions in variant_names(name).values()
+        for variant in extensions.values()
+    ]
+    if not force and all(map(default_storage.exists, variants)):
+        return
+    with default_storage.open(name) as source, Image.open(source) as image:
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            for extension, (image_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                convert(resized, image_format).save(
+                    buffer, image_format, **options
+                )
+                overwrite(
+                    variant_name(name, variant, extension), buffer.getvalue()
+                )
+
+
+def convert(image, image_format):
+    if image.mode == "RGB":
+        return image
+    if image_format == "WEBP" and image.mode == "RGBA":
+        return image
+    rgba = image.convert("RGBA")
+    if image_format == "WEBP":
+        return rgba
+    flattened = Image.new("RGB", image.size, "white")
+    flattened.paste(rgba, mask=rgba.getchannel("A"))
+    return flattened
+
+
+def process_stored(name):
+    """Sanitize a stored recipe image and rebuild its variants.
+
+    The re-encoded content gets a new content-addressed name, returned
+    along with the old one. Images already named after their content were
+    stored sanitized, they only get their missing variants: re-encoding
+    them again would lose quality on every run. Used by the backfill
+    command in worker processes, so it only touches the storage, never
+    the database.
+    """
+    field = Recipe._meta.get_field("image")
+    upload_name = field.generate_filename(None, posixpath.basename(name))
+    with field.storage.open(name) as source:
+        if field.storage.hashed_name(upload_name, source) == name:
+            generate_variants(name)
+            return name, name
+        content, image_format = reencode(source)
+    new_name = field.storage.save(
+        output_name(upload_name, image_format), ContentFile(content)
+    )
+    generate_variants(new_name, force=True)
+    return name, new_name
@@ -0,0 +1,412 @@
+import base64
+import io
+import json
+import math
+import time
+import tracemalloc
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.utils import CursorDebugWrapper
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.autocomplete import reset_index
+from api.cache import get_cache
+from api.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+Request = namedtuple(
+    "Request", ["method", "path", "data", "anonymous", "token"]
+)
+Request.__new__.__defaults__ = (None, False, None)
+
+
+class CountingCursor(CursorDebugWrapper):
+    """Counts the rows the ORM fetches through this cursor."""
+
+    rows = 0
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            CountingCursor.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        CountingCursor.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        CountingCursor.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            CountingCursor.rows += 1
+            yield row
+
+
+@contextmanager
+def counting_rows():
+    connection.make_debug_cursor = lambda cursor: CountingCursor(
+        cursor, connection
+    )
+    try:
+        yield
+    finally:
+        del connection.make_debug_cursor
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    rank = max(math.ceil(share / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summary(latencies):
+    if not latencies:
+        return None
+    return {
+        "requests": len(latencies),
+        "mean": round(sum(latencies) / len(latencies), 3),
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+    }
+
+
+def label(method, path):
+    """``GET recipes-list?tags`` for ``GET /api/recipes/?tags=hot``."""
+    url = urlsplit(path)
+    name = resolve(url.path).url_name
+    params = sorted({key for key, _ in parse_qsl(url.query, True)})
+    query = "?" + "&".join(params) if params else ""
+    return f"{method.upper()} {name}{query}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives every API endpoint through the test client against the "
+        "current (seeded) database and reports cold and warm latency "
+        "percentiles, queries, rows fetched and peak memory per endpoint. "
+        "Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, help="id of the user to send requests as"
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--cold-iterations", type=int, default=3)
+        parser.add_argument(
+            "--output", help="write the JSON report to this file"
+        )
+        parser.add_argument(
+            "--compare", help="JSON report of a previous run to compare with"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="allowed relative growth of p95 and rows, default 0.25",
+        )
+
+    def handle(self, *args, **options):
+        self.user = self.get_user(options["user"])
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(self.user)
+        self.anonymous = APIClient(raise_request_exception=False)
+        self.sequence = 0
+
+        report = {
+            "meta": {
+                "vendor": connection.vendor,
+                "created": timezone.now().isoformat(),
+                "iterations": options["iterations"],
+                "cold_iterations": options["cold_iterations"],
+                "recipes": Recipe.objects.count(),
+                "users": User.objects.count(),
+            },
+            "endpoints": {},
+        }
+        with transaction.atomic():
+            for scenario in self.get_scenarios():
+                self.measure(scenario, options, report["endpoints"])
+            transaction.set_rollback(True)
+
+        self.print_report(report["endpoints"])
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+        if options["compare"]:
+            with open(options["compare"]) as baseline:
+                baseline = json.load(baseline)
+            regressions = self.compare(
+                baseline["endpoints"],
+                report["endpoints"],
+                options["threshold"],
+            )
+            for regression in regressions:
+                self.stdout.write(f"REGRESSION {regression}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s)")
+
+    def get_user(self, pk):
+        if pk is not None:
+            return User.objects.get(pk=pk)
+        user = User.objects.filter(
+            pk__in=ShoppingCart.objects.values("user")
+        ).first()
+        if user is None:
+            raise CommandError("Seed the database first")
+        return user
+
+    def measure(self, scenario, options, endpoints):
+        latencies = defaultdict(lambda: {"cold": [], "warm": []})
+        stats = defaultdict(
+            lambda: {"queries": 0, "rows": 0, "peak_memory": 0, "status": []}
+        )
+
+        def record(run, measurements):
+            for key, measurement in measurements:
+                latencies[key][run].append(measurement["ms"])
+                result = stats[key]
+                result["queries"] = max(
+                    result["queries"], measurement["queries"]
+                )
+                result["rows"] = max(result["rows"], measurement["rows"])
+                if measurement["status"] not in result["status"]:
+                    result["status"].append(measurement["status"])
+
+        for _ in range(options["cold_iterations"]):
+            get_cache().clear()
+            reset_index()
+            record("cold", self.run(scenario))
+        self.run(scenario)
+        for _ in range(options["iterations"]):
+            record("warm", self.run(scenario))
+        for key, measurement in self.run(scenario, trace_memory=True):
+            stats[key]["peak_memory"] = max(
+                stats[key]["peak_memory"], measurement["peak_memory"]
+            )
+
+        for key, runs in latencies.items():
+            endpoints[key] = {
+                "cold": summary(runs["cold"]),
+                "warm": summary(runs["warm"]),
+                **stats[key],
+            }
+
+    def run(self, scenario, trace_memory=False):
+        """Send the requests of one scenario pass and measure each."""
+        measurements = []
+        requests = scenario()
+        response = None
+        while True:
+            try:
+                request = requests.send(response)
+            except StopIteration:
+                return measurements
+            client = self.anonymous if request.anonymous else self.client
+            headers = {}
+            if request.token:
+                headers["HTTP_AUTHORIZATION"] = f"Token {request.token}"
+            key = label(request.method, request.path)
+            CountingCursor.rows = 0
+            if trace_memory:
+                tracemalloc.start()
+            with counting_rows(), CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, request.method)(
+                    request.path, request.data, format="json", **headers
+                )
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            measurement = {
+                "ms": elapsed * 1000,
+                "queries": len(context),
+                "rows": CountingCursor.rows,
+                "status": response.status_code,
+            }
+            if trace_memory:
+                measurement["peak_memory"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if response.status_code >= 500:
+                raise CommandError(
+                    f"{key}: {response.status_code} {request.path}"
+                )
+            measurements.append((key, measurement))
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.filter(author__isnull=False).first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError("Seed the database first")
+        free = Recipe.objects.exclude(
+            pk__in=Favorite.objects.filter(user=self.user).values("recipe")
+        ).exclude(
+            pk__in=ShoppingCart.objects.filter(user=self.user).values(
+                "recipe"
+            )
+        )
+        free = free.first()
+        other = (
+            User.objects.exclude(pk=self.user.pk)
+            .exclude(following__user=self.user)
+            .first()
+        )
+        pantry = "&".join(
+            f"ingredients={ingredient}"
+            for ingredient in recipe.ingredient_recipe.values_list(
+                "ingredient", flat=True
+            )
+        )
+        reads = [
+            "/api/tags/",
+            f"/api/tags/{tag.pk}/",
+            "/api/ingredients/",
+            f"/api/ingredients/?name={ingredient.name[:2]}",
+            f"/api/ingredients/{ingredient.pk}/",
+            "/api/recipes/",
+            "/api/recipes/?page=5",
+            "/api/recipes/?cursor=",
+            f"/api/recipes/?tags={tag.slug}",
+            f"/api/recipes/?tags={tag.slug}&tags_mode=all&facets=true",
+            f"/api/recipes/?author={recipe.author_id}",
+            f"/api/recipes/?search={recipe.name.split()[0]}",
+            f"/api/recipes/pantry/?{pantry}",
+            "/api/recipes/?is_favorited=true",
+            "/api/recipes/?is_in_shopping_cart=true",
+            f"/api/recipes/{recipe.pk}/",
+            "/api/recipes/download_shopping_cart/",
+            "/api/recipes/download_shopping_cart/?format=pdf",
+            "/api/users/",
+            "/api/users/?page=2",
+            "/api/users/subscriptions/",
+            "/api/users/me/",
+            f"/api/users/{recipe.author_id}/",
+            "/api/cache/stats/",
+        ]
+        scenarios = [self.read(path) for path in reads]
+        scenarios += [self.recipe_write(tag, ingredient), self.registration]
+        if free is not None:
+            scenarios += [
+                self.toggle(f"/api/recipes/{free.pk}/favorite/"),
+                self.toggle(f"/api/recipes/{free.pk}/shopping_cart/"),
+            ]
+        if other is not None:
+            scenarios.append(self.toggle(f"/api/users/{other.pk}/subscribe/"))
+        return scenarios
+
+    @staticmethod
+    def read(path):
+        def scenario():
+            yield Request("get", path)
+
+        return scenario
+
+    @staticmethod
+    def toggle(path):
+        def scenario():
+            yield Request("get", path)
+            yield Request("delete", path)
+
+        return scenario
+
+    @staticmethod
+    def recipe_write(tag, ingredient):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "#d9a066").save(buffer, "PNG")
+        image = base64.b64encode(buffer.getvalue()).decode()
+        payload = {
+            "name": "benchmark",
+            "text": "benchmark",
+            "cooking_time": 10,
+            "image": f"data:image/png;base64,{image}",
+            "tags": [tag.pk],
+            "ingredients": [{"id": ingredient.pk, "amount": 1}],
+        }
+
+        def scenario():
+            response = yield Request("post", "/api/recipes/", payload)
+            path = f"/api/recipes/{response.data['id']}/"
+            yield Request("patch", path, {"cooking_time": 20})
+            yield Request("delete", path)
+
+        return scenario
+
+    def registration(self):
+        self.sequence += 1
+        credentials = {
+            "email": f"benchmark-{self.sequence}@example.com",
+            "password": "benchmark-password",
+        }
+        yield Request(
+            "post",
+            "/api/users/",
+            {
+                **credentials,
+                "username": f"benchmark-{self.sequence}",
+                "first_name": "Bench",
+                "last_name": "Mark",
+            },
+            anonymous=True,
+        )
+        response = yield Request(
+            "post", "/api/auth/token/login/", credentials, anonymous=True
+        )
+        yield Request(
+            "post",
+            "/api/auth/token/logout/",
+            anonymous=True,
+            token=response.data["auth_token"],
+        )
+
+    def print_report(self, endpoints):
+        self.stdout.write(
+            f"{'endpoint':<48} {'p50':>8} {'p95':>8} {'p99':>8} "
+            f"{'cold':>8} {'queries':>7} {'rows':>7} {'memory':>9}"
+        )
+        for key in sorted(endpoints):
+            result = endpoints[key]
+            warm, cold = result["warm"], result["cold"] or {}
+            self.stdout.write(
+                f"{key:<48} {warm['p50']:>8.2f} {warm['p95']:>8.2f} "
+                f"{warm['p99']:>8.2f} {cold.get('p50', 0):>8.2f} "
+                f"{result['queries']:>7} {result['rows']:>7} "
+                f"{result['peak_memory'] // 1024:>7}KB"
+            )
+
+    @staticmethod
+    def compare(baseline, current, threshold):
+        regressions = []
+        for key, result in sorted(current.items()):
+            before = baseline.get(key)
+            if before is None:
+                continue
+            if result["queries"] > before["queries"]:
+                regressions.append(
+                    f"{key}: {before['queries']} -> {result['queries']} "
+                    "queries"
+                )
+            for metric, value, previous in (
+                ("p95 ms", result["warm"]["p95"], before["warm"]["p95"]),
+                ("rows", result["rows"], before["rows"]),
+            ):
+                if value > previous * (1 + threshold) and value - previous > 1:
+                    regressions.append(
+                        f"{key}: {metric} {previous} -> {value}"
+                    )
+        return regressions
@@ -0,0 +1,142 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.diagnostics import EXPLAIN
+from api.models import Recipe, ShoppingCart, Tag
+from users.models import User
+
+# Virtual tables (the FTS5 search index) are scanned through their index.
+SEQUENTIAL_SCANS = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(
+        r"^SCAN (?:TABLE )?(\w+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs every endpoint against the current (seeded) database, "
+        "explains the SELECTs it executes and fails if any of them reads "
+        "a table with a sequential scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, help="id of the user to send requests as"
+        )
+        parser.add_argument(
+            "--allow",
+            nargs="*",
+            default=["api_tag"],
+            help="tables small enough to be scanned, default: api_tag",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(f"{connection.vendor} is not supported")
+
+        user = self.get_user(options["user"])
+        recipe = Recipe.objects.filter(author__isnull=False).first()
+        tag = Tag.objects.first()
+        other = User.objects.exclude(pk=user.pk).first()
+        if recipe is None or tag is None or other is None:
+            raise CommandError("Seed the database first")
+
+        client = APIClient()
+        client.force_authenticate(user)
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            for method, url in self.get_endpoints(recipe, tag, other):
+                with CaptureQueriesContext(connection) as context:
+                    response = getattr(client, method)(url)
+                if response.status_code >= 500:
+                    raise CommandError(
+                        f"{method.upper()} {url}: {response.status_code}"
+                    )
+                scans = self.get_scans(context, options["allow"])
+                status = "FAIL" if scans else "OK"
+                self.stdout.write(f"{status} {method.upper()} {url}")
+                for table, sql in scans:
+                    self.stdout.write(f"    {table}: {sql}")
+                    failures.append(url)
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                f"{len(set(failures))} endpoint(s) use sequential scans"
+            )
+
+    def get_user(self, pk):
+        if pk is not None:
+            return User.objects.get(pk=pk)
+        user = User.objects.filter(
+            pk__in=ShoppingCart.objects.values("user")
+        ).first()
+        if user is None:
+            raise CommandError("Seed the database first")
+        return user
+
+    def get_endpoints(self, recipe, tag, other):
+        pantry = "&".join(
+            f"ingredients={ingredient}"
+            for ingredient in recipe.ingredient_recipe.values_list(
+                "ingredient", flat=True
+            )
+        )
+        return [
+            ("get", "/api/recipes/"),
+            ("get", "/api/recipes/?page=2"),
+            ("get", "/api/recipes/?cursor="),
+            ("get", f"/api/recipes/?tags={tag.slug}"),
+            (
+                "get",
+                f"/api/recipes/?tags={tag.slug}&tags_mode=all&facets=true",
+            ),
+            ("get", f"/api/recipes/?author={recipe.author_id}"),
+            ("get", f"/api/recipes/?search={recipe.name.split()[0]}"),
+            ("get", f"/api/recipes/pantry/?{pantry}"),
+            ("get", "/api/recipes/?is_favorited=true"),
+            ("get", "/api/recipes/?is_in_shopping_cart=true"),
+            ("get", f"/api/recipes/{recipe.pk}/"),
+            ("get", "/api/recipes/download_shopping_cart/"),
+            ("get", "/api/users/"),
+            ("get", "/api/users/subscriptions/"),
+            ("get", "/api/users/subscriptions/?cursor="),
+            ("get", "/api/users/me/"),
+            ("get", f"/api/users/{other.pk}/"),
+            ("delete", f"/api/recipes/{recipe.pk}/favorite/"),
+            ("get", f"/api/recipes/{recipe.pk}/favorite/"),
+            ("delete", f"/api/recipes/{recipe.pk}/shopping_cart/"),
+            ("get", f"/api/recipes/{recipe.pk}/shopping_cart/"),
+            ("delete", f"/api/users/{other.pk}/subscribe/"),
+            ("get", f"/api/users/{other.pk}/subscribe/"),
+        ]
+
+    def get_scans(self, context, allowed):
+        pattern = SEQUENTIAL_SCANS[connection.vendor]
+        tables = set(connection.introspection.table_names())
+        scans = []
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(EXPLAIN[connection.vendor] + sql)
+                plan = cursor.fetchall()
+            for row in plan:
+                match = pattern.search(str(row[-1]).strip())
+                if (
+                    match
+                    and match.group(1) in tables
+                    and match.group(1) not in allowed
+                ):
+                    scans.append((match.group(1), sql))
+        return scans
@@ -0,0 +1,181 @@
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.images import variant_names
+from api.models import MediaFile, Recipe
+
+CHECKPOINT = ".cleanup_media"
+VARIANTS = "variants"
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes media files no recipe refers to: files whose reference "
+        "count dropped to zero and files under MEDIA_ROOT the database does "
+        "not know about, together with their variants. The scan of "
+        "MEDIA_ROOT resumes from the last finished directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60 * 60,
+            help="keep files modified less than this many seconds ago",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="scan MEDIA_ROOT from the start, ignoring the checkpoint",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        self.deadline = time.time() - options["min_age"]
+        self.root = settings.MEDIA_ROOT
+        self.checkpoint = os.path.join(self.root, CHECKPOINT)
+        self.removed = 0
+
+        self.remove_unreferenced()
+        self.scan(restart=options["restart"])
+        self.stdout.write(f"{self.removed} file(s) removed")
+
+    def remove_unreferenced(self):
+        """Delete files whose ``MediaFile`` count is zero, batch by batch."""
+        last = 0
+        while True:
+            batch = list(
+                MediaFile.objects.filter(references=0, pk__gt=last)
+                .order_by("pk")
+                .values_list("pk", "name")[: self.batch_size]
+            )
+            if not batch:
+                return
+            last = batch[-1][0]
+            names = {name for _, name in batch}
+            referenced = self.referenced(names)
+            orphans = [
+                (pk, name)
+                for pk, name in batch
+                if name not in referenced and self.is_stale(name)
+            ]
+            if self.dry_run:
+                continue
+            # The count drifted, recount instead of deleting a used file.
+            for name in referenced:
+                MediaFile.objects.filter(name=name).update(
+                    references=Recipe.objects.filter(image=name).count()
+                )
+            MediaFile.objects.filter(
+                pk__in=[pk for pk, _ in orphans], references=0
+            ).delete()
+            for _, name in orphans:
+                self.remove(name)
+                for extensions in variant_names(name).values():
+                    for variant in extensions.values():
+                        self.remove(variant)
+
+    def scan(self, restart=False):
+        """Walk MEDIA_ROOT and delete files nothing refers to.
+
+        Directories are visited in sorted order and the last finished one
+        is written to the checkpoint file, so an interrupted run carries on
+        where it stopped.
+        """
+        done = () if restart else self.read_checkpoint()
+        for path, directories, files in os.walk(self.root):
+            directories.sort()
+            relative = os.path.relpath(path, self.root)
+            parts = () if relative == "." else tuple(relative.split(os.sep))
+            if parts[-1:] == (VARIANTS,) or (done and parts <= done):
+                continue
+            directory = posixpath.join(*parts) if parts else ""
+            originals = sorted(
+                posixpath.join(directory, filename)
+                for filename in files
+                if not (parts == () and filename == CHECKPOINT)
+            )
+            kept = set()
+            for start in range(0, len(originals), self.batch_size):
+                batch = originals[start:start + self.batch_size]
+                referenced = self.referenced(batch) | set(
+                    MediaFile.objects.filter(
+                        name__in=batch, references__gt=0
+                    ).values_list("name", flat=True)
+                )
+                for name in batch:
+                    if name in referenced or not self.is_stale(name):
+                        kept.add(name)
+                    else:
+                        self.remove(name)
+            if VARIANTS in directories:
+                self.remove_stale_variants(directory, kept)
+            self.write_checkpoint(parts)
+        self.write_checkpoint(None)
+
+    def remove_stale_variants(self, directory, kept):
+        expected = {
+            variant
+            for name in kept
+            for extensions in variant_names(name).values()
+            for variant in extensions.values()
+        }
+        variants = posixpath.join(directory, VARIANTS)
+        for filename in sorted(os.listdir(os.path.join(self.root, variants))):
+            name = posixpath.join(variants, filename)
+            if name not in expected and self.is_stale(name):
+                self.remove(name)
+
+    def referenced(self, names):
+        return set(
+            Recipe.objects.filter(image__in=names)
+            .values_list("image", flat=True)
+            .distinct()
+        )
+
+    def is_stale(self, name):
+        try:
+            return os.path.getmtime(self.path(name)) < self.deadline
+        except FileNotFoundError:
+            return True
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def remove(self, name):
+        if self.dry_run:
+            self.stdout.write(f"would remove {name}")
+            return
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            return
+        self.removed += 1
+        if self.verbosity > 1:
+            self.stdout.write(f"removed {name}")
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint) as checkpoint:
+                relative = checkpoint.read().strip()
+        except FileNotFoundError:
+            return ()
+        return tuple(relative.split("/")) if relative else ()
+
+    def write_checkpoint(self, parts):
+        if self.dry_run:
+            return
+        if parts is None:
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+            return
+        with open(self.checkpoint, "w") as checkpoint:
+            checkpoint.write("/".join(parts))
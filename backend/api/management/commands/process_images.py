@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from api.cache import invalidate
+from api.images import process_stored
+from api.media import add_references, drop_references
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encodes every stored recipe image without metadata and builds "
+        "its resized variants, spread over a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1
+        )
+
+    def handle(self, *args, **options):
+        names = list(
+            dict.fromkeys(
+                Recipe.objects.exclude(image="")
+                .values_list("image", flat=True)
+                .iterator()
+            )
+        )
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            for name, new_name in pool.map(
+                process_stored, names, chunksize=16
+            ):
+                if new_name != name:
+                    self.rename(name, new_name)
+                processed += 1
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{name} -> {new_name}")
+        self.stdout.write(f"{processed} image(s) processed")
+
+    @staticmethod
+    def rename(name, new_name):
+        """Point recipes at the re-encoded file, the old one is orphaned.
+
+        update() sends no signals, so cached responses and ETags holding
+        the old image URL are invalidated here.
+        """
+        with transaction.atomic():
+            moved = Recipe.objects.filter(image=name).update(image=new_name)
+            drop_references(name, moved)
+            add_references(new_name, moved)
+            invalidate(Recipe)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max
+
+from api.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts favorites, recipes and followers and fixes the counter "
+        "columns that drifted, one primary key range at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model, field, counted_model, foreign_key in COUNTERS:
+            actual = actual_count(counted_model, foreign_key)
+            last = model.objects.aggregate(last=Max("pk"))["last"] or 0
+            fixed = 0
+            for start in range(0, last + 1, batch_size):
+                drifted = list(
+                    model.objects.filter(
+                        pk__gte=start, pk__lt=start + batch_size
+                    )
+                    .annotate(actual=actual)
+                    .exclude(**{field: F("actual")})
+                    .values_list("pk", flat=True)
+                )
+                if drifted:
+                    fixed += model.objects.filter(pk__in=drifted).update(
+                        **{field: actual}
+                    )
+            self.stdout.write(
+                f"{model._meta.label}.{field}: {fixed} row(s) fixed"
+            )
@@ -0,0 +1,280 @@
+import io
+import itertools
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from api.cache import invalidate
+from api.images import generate_variants, reencode
+from api.media import add_references
+from api.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                        ShoppingCart, Subscribe, Tag, TagRecipe)
+from api.pantry import invalidate_index
+from api.search import index_recipes
+from users.models import User
+
+WORDS = [
+    "суп", "салат", "пирог", "каша", "рагу", "запеканка", "паста", "плов",
+    "омлет", "блины", "котлеты", "соус", "борщ", "щи", "гуляш", "тушёный",
+    "жареный", "печёный", "домашний", "острый", "сладкий", "быстрый",
+    "летний", "зимний", "овощной", "куриный", "грибной", "рыбный",
+    "сырный", "ягодный",
+]
+START = datetime(2021, 7, 1, tzinfo=timezone.utc)
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ranks 1..count under Zipf's law."""
+    return list(
+        itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, count + 1)
+        )
+    )
+
+
+@contextmanager
+def explicit_pub_date():
+    """Let bulk_create keep the generated dates instead of now()."""
+    field = Recipe._meta.get_field("pub_date")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with a deterministic synthetic dataset: users, "
+        "recipes with tags and ingredients, and favorites, shopping carts "
+        "and subscriptions following power-law distributions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=8)
+        parser.add_argument(
+            "--favorites", type=int, default=10, help="average per user"
+        )
+        parser.add_argument(
+            "--carts", type=int, default=3, help="average per user"
+        )
+        parser.add_argument(
+            "--subscriptions", type=int, default=5, help="average per user"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.prefix = f"seed{options['seed']}-"
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f"Users of seed {options['seed']} exist, pick another --seed"
+            )
+
+        tags = self.seed_tags(options["tags"])
+        ingredients = self.seed_ingredients()
+        users = self.seed_users(options["users"])
+        if not users:
+            raise CommandError("--users must be positive")
+        recipes = self.seed_recipes(options["recipes"], users)
+        self.seed_recipe_relations(recipes, tags, ingredients)
+        index_recipes(recipes)
+        invalidate_index()
+        self.seed_user_relations(
+            Favorite, "recipe", users, recipes, options["favorites"]
+        )
+        self.seed_user_relations(
+            ShoppingCart, "recipe", users, recipes, options["carts"]
+        )
+        self.seed_user_relations(
+            Subscribe, "following", users, users, options["subscriptions"]
+        )
+
+        call_command("reconcile_counters", stdout=self.stdout)
+        for model in (Tag, Ingredient, Recipe, User):
+            invalidate(model)
+
+    def insert(self, model, objects):
+        """bulk_create ``objects`` lazily, ``batch_size`` rows at a time."""
+        objects = iter(objects)
+        total = 0
+        while True:
+            batch = list(itertools.islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(f"{model._meta.label}: {total} row(s)")
+
+    def new_ids(self, model, last):
+        return list(
+            model.objects.filter(pk__gt=last)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    @staticmethod
+    def last_id(model):
+        last = model.objects.order_by("-pk").values_list("pk", flat=True)
+        return last.first() or 0
+
+    def seed_tags(self, count):
+        existing = Tag.objects.count()
+        self.insert(
+            Tag,
+            (
+                Tag(
+                    name=f"{self.prefix}tag {number}",
+                    color=f"#{number:06x}",
+                    slug=f"{self.prefix}tag-{number}",
+                )
+                for number in range(existing, count)
+            ),
+        )
+        return list(Tag.objects.order_by("pk").values_list("pk", flat=True))
+
+    def seed_ingredients(self):
+        if not Ingredient.objects.exists():
+            fixture = os.path.join(settings.BASE_DIR, "ingredients_data.json")
+            call_command("loaddata", fixture, stdout=self.stdout)
+        return list(
+            Ingredient.objects.order_by("pk").values_list("pk", flat=True)
+        )
+
+    def seed_users(self, count):
+        last = self.last_id(User)
+        password = make_password(self.prefix)
+        self.insert(
+            User,
+            (
+                User(
+                    username=f"{self.prefix}{number}",
+                    email=f"{self.prefix}{number}@example.com",
+                    first_name=self.random.choice(WORDS).capitalize(),
+                    last_name=self.random.choice(WORDS).capitalize(),
+                    password=password,
+                )
+                for number in range(count)
+            ),
+        )
+        return self.new_ids(User, last)
+
+    def seed_recipes(self, count, users):
+        last = self.last_id(Recipe)
+        image = self.placeholder_image()
+        authors = zipf_weights(len(users), 1.1)
+        step = timedelta(days=3 * 365) / max(count, 1)
+        with explicit_pub_date():
+            self.insert(
+                Recipe,
+                (
+                    Recipe(
+                        author_id=self.random.choices(
+                            users, cum_weights=authors
+                        )[0],
+                        name=" ".join(self.random.sample(WORDS, 3)),
+                        text=" ".join(self.random.choices(WORDS, k=40)),
+                        image=image,
+                        cooking_time=self.random.randint(5, 180),
+                        pub_date=START + step * number,
+                    )
+                    for number in range(count)
+                ),
+            )
+        recipes = self.new_ids(Recipe, last)
+        add_references(image, len(recipes))
+        return recipes
+
+    def placeholder_image(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), "#d9a066").save(buffer, "JPEG")
+        buffer.seek(0)
+        field = Recipe._meta.get_field("image")
+        content, _ = reencode(buffer)
+        name = field.storage.save(
+            field.generate_filename(None, "seed.jpg"), ContentFile(content)
+        )
+        generate_variants(name)
+        return name
+
+    def seed_recipe_relations(self, recipes, tags, ingredients):
+        tag_weights = zipf_weights(len(tags), 1.0)
+        ingredient_weights = zipf_weights(len(ingredients), 1.0)
+        self.insert(
+            TagRecipe,
+            (
+                TagRecipe(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in self.pick(
+                    tags, tag_weights, self.random.randint(1, 3)
+                )
+            ),
+        )
+        self.insert(
+            IngredientRecipe,
+            (
+                IngredientRecipe(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in self.pick(
+                    ingredients,
+                    ingredient_weights,
+                    self.random.randint(3, 12),
+                )
+            ),
+        )
+
+    def seed_user_relations(self, model, field, users, targets, average):
+        """Per-user counts are Pareto, targets are picked by Zipf rank."""
+        if not average or not targets:
+            return
+        ranked = targets[:]
+        self.random.shuffle(ranked)
+        weights = zipf_weights(len(ranked), 1.0)
+        self.insert(
+            model,
+            (
+                model(user_id=user, **{f"{field}_id": target})
+                for user in users
+                for target in self.pick(
+                    ranked,
+                    weights,
+                    int(average / 2 * self.random.paretovariate(2)),
+                    exclude=user if field == "following" else None,
+                )
+            ),
+        )
+
+    def pick(self, population, cum_weights, count, exclude=None):
+        """``count`` distinct weighted picks from ``population``."""
+        candidates = len(population) - (exclude is not None)
+        count = min(count, candidates)
+        if count * 2 > candidates:
+            return sorted(
+                self.random.sample(
+                    [item for item in population if item != exclude], count
+                )
+            )
+        picked = set()
+        while len(picked) < count:
+            for item in self.random.choices(
+                population, cum_weights=cum_weights, k=count - len(picked)
+            ):
+                if item != exclude:
+                    picked.add(item)
+        return sorted(picked)
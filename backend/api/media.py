@@ -0,0 +1,29 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MediaFile
+
+
+def add_references(name, count=1):
+    if not name or not count:
+        return
+    if MediaFile.objects.filter(name=name).update(
+        references=F("references") + count
+    ):
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, references=count)
+    except IntegrityError:
+        MediaFile.objects.filter(name=name).update(
+            references=F("references") + count
+        )
+
+
+def drop_references(name, count=1):
+    """Decrement the count, the file itself is left for ``cleanup_media``."""
+    if not name or not count:
+        return
+    MediaFile.objects.filter(name=name, references__gte=count).update(
+        references=F("references") - count
+    )
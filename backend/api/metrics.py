@@ -0,0 +1,249 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import locks
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (
+    1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20,
+)
+# name: (help, buckets)
+HISTOGRAMS = {
+    "foodgram_request_duration_seconds": (
+        "Total time spent on a request.",
+        TIME_BUCKETS,
+    ),
+    "foodgram_request_sql_seconds": (
+        "Time spent in SQL queries during a request.",
+        TIME_BUCKETS,
+    ),
+    "foodgram_request_view_seconds": (
+        "Python time in the view (serializers included) minus SQL time.",
+        TIME_BUCKETS,
+    ),
+    "foodgram_request_render_seconds": (
+        "Time spent rendering the response body.",
+        TIME_BUCKETS,
+    ),
+    "foodgram_request_queries": (
+        "SQL queries executed during a request.",
+        QUERY_BUCKETS,
+    ),
+    "foodgram_response_size_bytes": (
+        "Size of the response body.",
+        SIZE_BUCKETS,
+    ),
+}
+
+
+TOTALS = "totals.json"
+WORKER_FILE = re.compile(r"(\d+)-\d+\.json")
+
+
+class Registry:
+    """Histograms of this process, flushed to ``METRICS_DIR``.
+
+    Every worker owns a file named after its pid and start time, so
+    nothing is shared between processes while requests are served and a
+    reused pid never overwrites an older worker's file. Files of workers
+    that exited are merged into ``totals.json``, so ``collect()`` never
+    sees the totals go down.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed = 0
+        self.pid = None
+        self.filename = None
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = json.dumps([name, sorted(labels.items())])
+        with self.lock:
+            self.own()
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    "buckets": [0] * (len(buckets) + 1),
+                    "sum": 0,
+                    "count": 0,
+                }
+            series["buckets"][bisect_left(buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def own(self):
+        """Start over in a new process, forked workers inherit the parent's
+        registry and the parent flushes its series itself.
+        """
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        if self.pid is None:
+            atexit.register(self.close)
+        self.pid = pid
+        self.filename = f"{pid}-{time.time_ns()}.json"
+        self.series = {}
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        with self.lock:
+            self.own()
+            content = json.dumps(self.series)
+        directory = settings.METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        write(os.path.join(directory, self.filename), content)
+
+    def close(self):
+        """Merge this worker's series into the totals, on exit."""
+        if self.pid != os.getpid():
+            return
+        self.flush(force=True)
+        merge(settings.METRICS_DIR, [self.filename])
+
+
+registry = Registry()
+
+
+def write(path, content):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as output:
+        output.write(content)
+    os.replace(temporary, path)
+
+
+def load(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return {}
+
+
+def add_series(merged, series):
+    for key, values in series.items():
+        total = merged.setdefault(
+            key,
+            {
+                "buckets": [0] * len(values["buckets"]),
+                "sum": 0,
+                "count": 0,
+            },
+        )
+        for index, count in enumerate(values["buckets"]):
+            total["buckets"][index] += count
+        total["sum"] += values["sum"]
+        total["count"] += values["count"]
+    return merged
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+@contextmanager
+def totals_lock(directory):
+    """Keep workers from merging into the totals, or reading them, at the
+    same time, which would count a file twice.
+    """
+    with open(os.path.join(directory, "totals.lock"), "a") as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(lock)
+
+
+def merge(directory, filenames):
+    """Add worker files to the totals and remove them."""
+    with totals_lock(directory):
+        paths = [
+            os.path.join(directory, filename)
+            for filename in filenames
+            if os.path.exists(os.path.join(directory, filename))
+        ]
+        if not paths:
+            return
+        totals = load(os.path.join(directory, TOTALS))
+        for path in paths:
+            add_series(totals, load(path))
+        write(os.path.join(directory, TOTALS), json.dumps(totals))
+        for path in paths:
+            os.remove(path)
+
+
+def merge_exited(directory):
+    """Merge the files of workers that died without merging them."""
+    exited = []
+    for filename in os.listdir(directory):
+        match = WORKER_FILE.fullmatch(filename)
+        if match and not is_alive(int(match.group(1))):
+            exited.append(filename)
+    merge(directory, exited)
+
+
+def read_series(directory):
+    merged = {}
+    with totals_lock(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json"):
+                add_series(merged, load(os.path.join(directory, filename)))
+    return merged
+
+
+def format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in labels
+    )
+
+
+def collect():
+    """Render the histograms of every worker in Prometheus text format."""
+    registry.flush(force=True)
+    merge_exited(settings.METRICS_DIR)
+    series = read_series(settings.METRICS_DIR)
+    by_name = {}
+    for key, values in series.items():
+        name, labels = json.loads(key)
+        by_name.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in sorted(
+            by_name.get(name, []), key=lambda item: item[0]
+        ):
+            cumulative = 0
+            bounds = [*buckets, "+Inf"]
+            for bound, count in zip(bounds, values["buckets"]):
+                cumulative += count
+                bucket = format_labels([*labels, ("le", bound)])
+                lines.append(f"{name}_bucket{{{bucket}}} {cumulative}")
+            plain = format_labels(labels)
+            lines.append(f"{name}_sum{{{plain}}} {values['sum']}")
+            lines.append(f"{name}_count{{{plain}}} {values['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import registry
+
+
+class QueryTimer:
+    """``execute_wrapper`` adding up the time and number of SQL queries."""
+
+    def __init__(self):
+        self.duration = 0
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class InstrumentationMiddleware:
+    """Measures every request per resolved URL name.
+
+    The total, SQL, view and render times go out in a ``Server-Timing``
+    header and, together with the query count and response size, into
+    the histograms served on ``/metrics``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        timer = QueryTimer()
+        request._instrumentation = {"render": 0}
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        total = finished - started
+
+        timings = request._instrumentation
+        view = max(
+            timings.get("view_end", finished)
+            - timings.get("view_start", started)
+            - timer.duration,
+            0,
+        )
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timer.duration * 1000:.2f};desc="{timer.count} '
+                'queries"',
+                f"view;dur={view * 1000:.2f}",
+                f"render;dur={timings['render'] * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+
+        match = request.resolver_match
+        labels = {
+            "endpoint": match.url_name if match else "unmatched",
+            "method": request.method,
+            "status": response.status_code,
+        }
+        observations = {
+            "foodgram_request_duration_seconds": total,
+            "foodgram_request_sql_seconds": timer.duration,
+            "foodgram_request_view_seconds": view,
+            "foodgram_request_render_seconds": timings["render"],
+            "foodgram_request_queries": timer.count,
+        }
+        if not response.streaming:
+            observations["foodgram_response_size_bytes"] = len(
+                response.content
+            )
+        for name, value in observations.items():
+            registry.observe(name, labels, value)
+        registry.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation["view_start"] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = request._instrumentation
+        timings["view_end"] = time.perf_counter()
+
+        def rendered(response):
+            timings["render"] = time.perf_counter() - timings["view_end"]
+
+        response.add_post_render_callback(rendered)
+        return response
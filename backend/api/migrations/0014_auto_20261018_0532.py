@@ -0,0 +1,21 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_auto_20261018_0524'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['user', '-id'], name='subscribe_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_auto_20261018_0532'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientrecipe',
+            index=models.Index(fields=['recipe', 'ingredient'], name='ingredient_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagrecipe',
+            index=models.Index(fields=['tag', 'recipe'], name='tag_recipe_idx'),
+        ),
+    ]
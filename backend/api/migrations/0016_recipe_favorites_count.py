@@ -0,0 +1,47 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, foreign_key):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    Favorite = apps.get_model('api', 'Favorite')
+    Subscribe = apps.get_model('api', 'Subscribe')
+    User = apps.get_model('users', 'User')
+    Recipe.objects.update(favorites_count=count(Favorite, 'recipe'))
+    User.objects.update(
+        recipes_count=count(Recipe, 'author'),
+        followers_count=count(Subscribe, 'following'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_auto_20261018_0533'),
+        ('users', '0002_auto_20261018_0535'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='favorites_count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
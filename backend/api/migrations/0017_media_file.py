@@ -0,0 +1,55 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:41
+
+import api.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_references(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    MediaFile = apps.get_model('api', 'MediaFile')
+    images = (
+        Recipe.objects.exclude(image='')
+        .order_by()
+        .values('image')
+        .annotate(references=Count('pk'))
+    )
+    MediaFile.objects.bulk_create(
+        (
+            MediaFile(name=row['image'], references=row['references'])
+            for row in images.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='name')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='references')),
+            ],
+            options={
+                'verbose_name': 'media_file',
+                'verbose_name_plural': 'media_files',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=api.storage.ContentAddressedStorage(), upload_to='recipes', verbose_name='image'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['references', 'id'], name='media_file_references_idx'),
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
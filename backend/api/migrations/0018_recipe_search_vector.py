@@ -0,0 +1,31 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:58
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from api import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor.connection)
+    search.index_recipes(using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_media_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search_vector'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
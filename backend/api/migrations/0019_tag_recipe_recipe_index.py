@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2026-10-18 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tagrecipe',
+            index=models.Index(fields=['recipe', 'tag'], name='recipe_tag_idx'),
+        ),
+    ]
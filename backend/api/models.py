@@ -1,7 +1,10 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
-from users.models import User
+from users.models import CountersMixin, User
+
+from .storage import ContentAddressedStorage
 
 
 class Ingredient(models.Model):
@@ -13,6 +16,13 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = "ingredient"
         verbose_name_plural = "ingredients"
+        indexes = [
+            models.Index(
+                fields=["name"],
+                name="ingredient_name_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
 
 class Tag(models.Model):
@@ -25,12 +35,16 @@ class Tag(models.Model):
         verbose_name_plural = "tags"
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User, related_name="recipes", on_delete=models.SET_NULL, null=True
     )
     name = models.CharField(max_length=100, verbose_name="name")
-    image = models.ImageField(verbose_name="image", upload_to="recipes")
+    image = models.ImageField(
+        verbose_name="image",
+        upload_to="recipes",
+        storage=ContentAddressedStorage(),
+    )
     text = models.TextField(verbose_name="text")
     ingredients = models.ManyToManyField(
         Ingredient, through="IngredientRecipe", verbose_name="ingredients"
@@ -42,13 +56,26 @@ class Recipe(models.Model):
         verbose_name="cooking_time", validators=[MinValueValidator(1)]
     )
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name="pub_date")
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="favorites_count"
+    )
+    counter_fields = ("favorites_count",)
+    # Maintained by api.search, the GIN index is created by its migration.
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name="search_vector"
+    )
 
     class Meta:
         verbose_name = "recipe"
         verbose_name_plural = "recipes"
-
-    def count_favorites(self):
-        return self.favorite.count()
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date"], name="recipe_author_date_idx"
+            ),
+        ]
 
 
 class IngredientRecipe(models.Model):
@@ -71,6 +98,12 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = "ingredient_recipe"
         verbose_name_plural = "ingredient_recipes"
+        indexes = [
+            models.Index(
+                fields=["recipe", "ingredient"],
+                name="ingredient_recipe_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.ingredient} {self.recipe}"
@@ -87,6 +120,10 @@ class TagRecipe(models.Model):
     class Meta:
         verbose_name = "tag_recipe"
         verbose_name_plural = "tag_recipes"
+        indexes = [
+            models.Index(fields=["tag", "recipe"], name="tag_recipe_idx"),
+            models.Index(fields=["recipe", "tag"], name="recipe_tag_idx"),
+        ]
 
     def __str__(self):
         return f"{self.tag} {self.recipe}"
@@ -114,6 +151,9 @@ class Subscribe(models.Model):
                 fields=["user", "following"], name="unique_follow"
             ),
         ]
+        indexes = [
+            models.Index(fields=["user", "-id"], name="subscribe_user_id_idx"),
+        ]
         verbose_name = "subscribe"
         verbose_name_plural = "subscribes"
 
@@ -168,3 +208,22 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = "shopping_cart"
         verbose_name_plural = "shopping_carts"
+
+
+class MediaFile(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name="name")
+    references = models.PositiveIntegerField(
+        default=0, verbose_name="references"
+    )
+
+    class Meta:
+        verbose_name = "media_file"
+        verbose_name_plural = "media_files"
+        indexes = [
+            models.Index(
+                fields=["references", "id"], name="media_file_references_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
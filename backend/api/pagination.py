@@ -0,0 +1,182 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset):
+    """Return the planner's row estimate instead of running COUNT(*).
+
+    Only PostgreSQL exposes the estimate, other databases get an exact
+    count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ApproximatePaginator(Paginator):
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class KeysetPagination(BasePagination):
+    """Seeks past the last row of the previous page instead of OFFSET.
+
+    ``ordering`` lists the model fields the cursor is built from, the last
+    one has to be unique. The cursor is the base64 JSON of the last row's
+    values, so every page is an index range scan whatever its depth.
+    """
+
+    cursor_query_param = "cursor"
+
+    def __init__(self, ordering, page_size, counter=None):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.counter = counter
+        self.count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if self.counter is not None:
+            self.count = self.counter(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response["count"] = self.count
+        response["next"] = self.get_next_link()
+        response["previous"] = None
+        response["results"] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [
+            getattr(last, field.lstrip("-")) for field in self.ordering
+        ]
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(position, default=str).encode()
+        ).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request, queryset):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(
+            self.ordering
+        ):
+            raise NotFound("Invalid cursor")
+        return [
+            self.coerce(self.get_field(queryset, field), value)
+            for field, value in zip(self.ordering, position)
+        ]
+
+    @staticmethod
+    def get_field(queryset, field):
+        name = field.lstrip("-")
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def coerce(field, value):
+        """The cursor value as the field's type, ``NotFound`` if it isn't."""
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise NotFound("Invalid cursor")
+        try:
+            value = field.to_python(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if value is None:
+            raise NotFound("Invalid cursor")
+        return value
+
+    def seek(self, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+
+class FeedPagination(PageNumberPagination):
+    """Page numbers by default, keyset pages when ``cursor`` is passed.
+
+    ``count=approximate`` replaces the exact COUNT(*) with the planner's
+    estimate; keyset pages only carry a count when it is asked for.
+    """
+
+    page_size_query_param = "limit"
+    max_page_size = 100
+    keyset_ordering = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        approximate = request.query_params.get("count") == "approximate"
+        self.keyset = None
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(
+                self.keyset_ordering,
+                self.get_page_size(request),
+                counter=approximate_count if approximate else None,
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        if approximate:
+            self.django_paginator_class = ApproximatePaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(FeedPagination):
+    keyset_ordering = ("-pub_date", "-id")
+
+
+class SubscriptionPagination(FeedPagination):
+    keyset_ordering = ("-subscription_id",)
+
+
+class PantryPagination(PageNumberPagination):
+    page_size_query_param = "limit"
+    max_page_size = 100
@@ -0,0 +1,195 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from collections.abc import Sequence
+from itertools import chain
+
+from django.db import transaction
+
+from .cache import get_cache
+from .models import IngredientRecipe
+
+SEQUENCE_KEY = "pantry:sequence"
+JOURNAL_KEY = "pantry:journal:{}"
+# Changes a worker may lag behind before it rebuilds instead of catching up.
+JOURNAL_SIZE = 1000
+JOURNAL_TIMEOUT = 24 * 60 * 60
+
+Match = namedtuple("Match", "recipe covered missing")
+
+
+class Matches(Sequence):
+    """Sorted ``(-covered, missing, -recipe)`` keys read as ``Match``es.
+
+    Only the page that is sliced out gets converted.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.match(key) for key in self.keys[index]]
+        return self.match(self.keys[index])
+
+    @staticmethod
+    def match(key):
+        covered, missing, recipe = key
+        return Match(-recipe, -covered, missing)
+
+
+class PantryIndex:
+    """Inverted index from ingredients to the recipes using them.
+
+    Every ingredient maps to a sorted array of recipe ids. Matching a pantry
+    counts, over the arrays of its ingredients, how often each recipe
+    occurs: that is how many of its ingredients are covered, the rest are
+    missing. Recipes are added and removed in place when they change.
+    """
+
+    def __init__(self, rows):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.ingredients = {}
+        for recipe, ingredient in rows:
+            self.postings.setdefault(ingredient, []).append(recipe)
+            self.ingredients.setdefault(recipe, []).append(ingredient)
+        self.postings = {
+            ingredient: array("q", sorted(recipes))
+            for ingredient, recipes in self.postings.items()
+        }
+        self.ingredients = {
+            recipe: tuple(ingredients)
+            for recipe, ingredients in self.ingredients.items()
+        }
+        self.sizes = {
+            recipe: len(ingredients)
+            for recipe, ingredients in self.ingredients.items()
+        }
+
+    def update(self, recipes):
+        """Replace the ingredients of ``recipes``, a recipe id: ids mapping.
+
+        A recipe mapped to no ingredients is dropped from the index.
+        """
+        with self.lock:
+            for recipe, ingredients in recipes.items():
+                self.sizes.pop(recipe, None)
+                for ingredient in self.ingredients.pop(recipe, ()):
+                    posting = self.postings[ingredient]
+                    del posting[bisect_left(posting, recipe)]
+                    if not posting:
+                        del self.postings[ingredient]
+                for ingredient in ingredients:
+                    posting = self.postings.setdefault(ingredient, array("q"))
+                    posting.insert(bisect_left(posting, recipe), recipe)
+                if ingredients:
+                    self.ingredients[recipe] = tuple(ingredients)
+                    self.sizes[recipe] = len(ingredients)
+
+    def match(self, pantry, max_missing=None):
+        """Recipes using anything from ``pantry``, best covered first.
+
+        With ``max_missing`` only recipes lacking at most that many
+        ingredients are returned.
+        """
+        with self.lock:
+            covered = Counter(
+                chain.from_iterable(
+                    self.postings.get(ingredient, ())
+                    for ingredient in set(pantry)
+                )
+            )
+            sizes = self.sizes
+            keys = [
+                (-count, sizes[recipe] - count, -recipe)
+                for recipe, count in covered.items()
+            ]
+        if max_missing is not None:
+            keys = [key for key in keys if key[1] <= max_missing]
+        keys.sort()
+        return Matches(keys)
+
+
+def read_ingredients(recipe_ids=None):
+    rows = IngredientRecipe.objects.order_by()
+    if recipe_ids is not None:
+        rows = rows.filter(recipe__in=recipe_ids)
+    return rows.values_list("recipe", "ingredient").iterator()
+
+
+def next_sequence(cache, delta=1):
+    try:
+        return cache.incr(SEQUENCE_KEY, delta)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        return cache.incr(SEQUENCE_KEY, delta)
+
+
+def journal(recipe_id):
+    cache = get_cache()
+    sequence = next_sequence(cache)
+    cache.set(JOURNAL_KEY.format(sequence), recipe_id, JOURNAL_TIMEOUT)
+
+
+def record_change(recipe_id):
+    """Tell every worker the ingredients of a recipe changed.
+
+    The change is journaled now and again on commit, like
+    ``cache.invalidate``, so a worker catching up before the commit does
+    not keep the old ingredients.
+    """
+    journal(recipe_id)
+    transaction.on_commit(lambda: journal(recipe_id))
+
+
+def invalidate_index():
+    """Make every worker rebuild its index, after bulk imports."""
+    next_sequence(get_cache(), JOURNAL_SIZE + 1)
+
+
+_index = None
+_sequence = None
+_lock = threading.Lock()
+
+
+def get_pantry_index():
+    """Return the index after applying the changes journaled since.
+
+    A worker too far behind, or missing journal entries, rebuilds it.
+    """
+    global _index, _sequence
+    cache = get_cache()
+    sequence = cache.get(SEQUENCE_KEY, 0)
+    if _index is not None and _sequence == sequence:
+        return _index
+    with _lock:
+        if _index is not None and _sequence == sequence:
+            return _index
+        changes = {}
+        if _index is not None and 0 < sequence - _sequence <= JOURNAL_SIZE:
+            keys = [
+                JOURNAL_KEY.format(number)
+                for number in range(_sequence + 1, sequence + 1)
+            ]
+            changes = cache.get_many(keys)
+            if len(changes) < len(keys):
+                changes = {}
+        if changes:
+            recipes = {recipe: [] for recipe in changes.values()}
+            for recipe, ingredient in read_ingredients(list(recipes)):
+                recipes[recipe].append(ingredient)
+            _index.update(recipes)
+        else:
+            _index = PantryIndex(read_ingredients())
+        _sequence = sequence
+        return _index
+
+
+def reset_pantry_index():
+    global _index
+    _index = None
@@ -0,0 +1,196 @@
+import csv
+import json
+from itertools import islice
+
+from rest_framework import renderers
+
+WISHLIST_FOOTER = "Foodgram, 07/2021"
+
+
+class Echo:
+    """File-like object that hands written values back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRendererMixin:
+    """Streams shopping list rows of (name, amount, measurement_unit).
+
+    ``render`` is only used by DRF for error responses, the list itself is
+    produced lazily by ``stream`` so large carts are never held in memory.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    @staticmethod
+    def lines(rows):
+        for name, amount, measurement_unit in rows:
+            yield f"{name} - {amount} {measurement_unit}"
+
+
+class PlainTextRenderer(ShoppingListRendererMixin, renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, rows):
+        for line in self.lines(rows):
+            yield f"{line}\n"
+        yield "\n"
+        yield WISHLIST_FOOTER
+
+
+class CSVRenderer(ShoppingListRendererMixin, renderers.BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(["name", "amount", "measurement_unit"])
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class JSONRenderer(renderers.JSONRenderer, ShoppingListRendererMixin):
+    def stream(self, rows):
+        separator = ""
+        yield "["
+        for name, amount, measurement_unit in rows:
+            item = {
+                "name": name,
+                "amount": amount,
+                "measurement_unit": measurement_unit,
+            }
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ","
+        yield "]"
+
+
+class PDFRenderer(ShoppingListRendererMixin, renderers.BaseRenderer):
+    """Writes a PDF page by page while rows are read from the database.
+
+    Only byte offsets of the written objects are kept, the page tree is
+    emitted last, once the number of pages is known. Text uses the built-in
+    Helvetica font with a cp1251 encoding, so Cyrillic names need no
+    embedded font.
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    lines_per_page = 48
+    font_size = 11
+    leading = 16
+    page_width = 595
+    page_height = 842
+    margin = 42
+
+    catalog_id = 1
+    pages_id = 2
+    font_id = 3
+
+    # cp1251 keeps Ё and ё apart from the alphabet at 0xC0-0xFF, while the
+    # Adobe glyph names put them right after Е and е.
+    cyrillic = [
+        *range(10017, 10023),
+        *range(10024, 10050),
+        *range(10065, 10071),
+        *range(10072, 10098),
+    ]
+    font = (
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding "
+        b"/Differences [168 /afii10023 184 /afii10071 192 "
+        + b" ".join(b"/afii%d" % code for code in cyrillic)
+        + b"] >> >>"
+    )
+
+    def stream(self, rows):
+        offsets = {}
+        chunk = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        position = len(chunk)
+        yield chunk
+        for number, body in self.objects(rows):
+            offsets[number] = position
+            chunk = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+            position += len(chunk)
+            yield chunk
+
+        size = max(offsets) + 1
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % size]
+        for number in range(1, size):
+            xref.append(b"%010d 00000 n \n" % offsets[number])
+        xref.append(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, self.catalog_id, position)
+        )
+        yield b"".join(xref)
+
+    def objects(self, rows):
+        yield self.catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % (
+            self.pages_id
+        )
+        yield self.font_id, self.font
+
+        kids = []
+        number = self.font_id + 1
+        lines = iter(self.text(rows))
+        page = list(islice(lines, self.lines_per_page))
+        while page:
+            content = self.content(page)
+            yield number, b"<< /Length %d >>\nstream\n%s\nendstream" % (
+                len(content),
+                content,
+            )
+            yield number + 1, (
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /Font << /F1 %d 0 R >> >> "
+                b"/Contents %d 0 R >>"
+                % (
+                    self.pages_id,
+                    self.page_width,
+                    self.page_height,
+                    self.font_id,
+                    number,
+                )
+            )
+            kids.append(number + 1)
+            number += 2
+            page = list(islice(lines, self.lines_per_page))
+
+        yield self.pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % kid for kid in kids),
+            len(kids),
+        )
+
+    def text(self, rows):
+        yield from self.lines(rows)
+        yield ""
+        yield WISHLIST_FOOTER
+
+    def content(self, page):
+        commands = [
+            b"BT",
+            b"/F1 %d Tf" % self.font_size,
+            b"%d TL" % self.leading,
+            b"%d %d Td" % (self.margin, self.page_height - self.margin),
+        ]
+        for line in page:
+            commands.append(b"(%s) Tj T*" % self.escape(line))
+        commands.append(b"ET")
+        return b"\n".join(commands)
+
+    @staticmethod
+    def escape(line):
+        return (
+            line.encode("cp1251", errors="replace")
+            .replace(b"\\", b"\\\\")
+            .replace(b"(", b"\\(")
+            .replace(b")", b"\\)")
+        )
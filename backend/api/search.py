@@ -0,0 +1,167 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+CONFIG = "russian"
+FTS_TABLE = "api_recipe_fts"
+BATCH_SIZE = 500
+WORDS = re.compile(r"\w+")
+INGREDIENT_NAMES = """
+    SELECT {aggregate}(api_ingredient.name, ' ')
+    FROM api_ingredientrecipe
+    JOIN api_ingredient
+        ON api_ingredient.id = api_ingredientrecipe.ingredient_id
+    WHERE api_ingredientrecipe.recipe_id = api_recipe.id
+"""
+# Recipe name, ingredient names and text, in this order of weight.
+POSTGRES_UPDATE = """
+    UPDATE api_recipe SET search_vector =
+        setweight(to_tsvector('{config}', api_recipe.name), 'A')
+        || setweight(
+            to_tsvector('{config}', coalesce(({ingredients}), '')), 'B'
+        )
+        || setweight(to_tsvector('{config}', api_recipe.text), 'C')
+    WHERE {{condition}}
+""".format(
+    config=CONFIG,
+    ingredients=INGREDIENT_NAMES.format(aggregate="string_agg"),
+)
+SQLITE_DELETE = f"DELETE FROM {FTS_TABLE} WHERE {{condition}}"
+SQLITE_INSERT = """
+    INSERT INTO {table} (rowid, name, ingredients, text)
+    SELECT
+        api_recipe.id,
+        api_recipe.name,
+        coalesce(({ingredients}), ''),
+        api_recipe.text
+    FROM api_recipe
+    WHERE {{condition}}
+""".format(
+    table=FTS_TABLE,
+    ingredients=INGREDIENT_NAMES.format(aggregate="group_concat"),
+)
+# vendor: [(statement, recipe id column)]
+STATEMENTS = {
+    "postgresql": [(POSTGRES_UPDATE, "api_recipe.id")],
+    "sqlite": [(SQLITE_DELETE, "rowid"), (SQLITE_INSERT, "api_recipe.id")],
+}
+
+
+def create_index(connection):
+    """Create the GIN index or the FTS5 table, for migrations."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "CREATE INDEX recipe_search_vector_idx "
+                "ON api_recipe USING gin (search_vector)"
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+                "USING fts5(name, ingredients, text, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("DROP INDEX recipe_search_vector_idx")
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DROP TABLE {FTS_TABLE}")
+
+
+def index_recipes(recipe_ids=None, using=DEFAULT_DB_ALIAS):
+    """Rebuild the search document of the given recipes, of all by default.
+
+    Recipes that no longer exist are dropped from the SQLite table, so this
+    is called after deletes as well.
+    """
+    connection = connections[using]
+    statements = STATEMENTS.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            for statement, column in statements:
+                cursor.execute(statement.format(condition="1 = 1"))
+            return
+        recipe_ids = list(recipe_ids)
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            for statement, column in statements:
+                cursor.execute(
+                    statement.format(
+                        condition=f"{column} IN ({placeholders})"
+                    ),
+                    batch,
+                )
+
+
+def match_expression(query):
+    """Every word of ``query`` as an FTS5 prefix term, all required."""
+    return " ".join(
+        '"{}"*'.format(word) for word in WORDS.findall(query.casefold())
+    )
+
+
+def search_recipes(queryset, query):
+    """Recipes of ``queryset`` matching ``query``.
+
+    PostgreSQL matches the ``search_vector`` column with the Russian
+    stemmer, SQLite the FTS5 table with prefix matching on every word.
+    The filter does not refer to the outer table, so the result can be
+    nested in other queries, e.g. for facet counts.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return queryset.filter(
+            search_vector=SearchQuery(query, config=CONFIG)
+        )
+    if vendor == "sqlite":
+        match = match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                [match],
+            )
+        )
+    return queryset.filter(name__icontains=query)
+
+
+def rank_recipes(queryset, query):
+    """Annotate ``rank``, higher is better, and order by it.
+
+    Meant for the outermost query only: on SQLite the FTS5 table is
+    joined to read bm25(), which refers to ``api_recipe`` by name.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        queryset = queryset.annotate(
+            rank=SearchRank(
+                F("search_vector"), SearchQuery(query, config=CONFIG)
+            )
+        )
+    elif vendor == "sqlite":
+        match = match_expression(query)
+        if not match:
+            return queryset
+        # One MATCH for the whole query, a correlated subquery would run
+        # it again per row. bm25() is lower for better matches and the
+        # name weighs the most.
+        queryset = queryset.extra(
+            select={"rank": f"-bm25({FTS_TABLE}, 10.0, 5.0, 1.0)"},
+            tables=[FTS_TABLE],
+            where=[
+                f"{FTS_TABLE}.rowid = api_recipe.id",
+                f"{FTS_TABLE} MATCH %s",
+            ],
+            params=[match],
+        )
+    else:
+        return queryset
+    return queryset.order_by("-rank", "-pub_date", "-id")
@@ -1,11 +1,52 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from users.models import User
 
+from .images import generate_variants, sanitize, variant_names
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Subscribe, Tag)
+                     ShoppingCart, Subscribe, Tag, TagRecipe)
+from .pantry import record_change
+from .search import index_recipes
+from .uploads import UploadTooLarge, get_limit
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized JPEG/WebP variants of an image field."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("source", "image")
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        request = self.context.get("request")
+        variants = {}
+        for variant, names in variant_names(value.name).items():
+            variants[variant] = {}
+            for extension, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[variant][extension] = url
+        return variants
+
+
+class RecipeImageField(Base64ImageField):
+    """Takes the image as a base64 string or as a multipart file."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if len(data) * 3 // 4 > get_limit():
+                raise UploadTooLarge()
+            return super().to_internal_value(data)
+        return serializers.ImageField.to_internal_value(self, data)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -21,41 +62,20 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientRecipeReadSerializer(serializers.ModelSerializer):
-    amount = serializers.SerializerMethodField(read_only=True)
-
-    class Meta:
-        model = Ingredient
-        fields = ["id", "name", "measurement_unit", "amount"]
-
-    def get_amount(self, obj):
-        return IngredientRecipe.objects.get(
-            recipe=self.context["recipe"], ingredient=obj
-        ).amount
-
-
-class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
-    id = serializers.SlugRelatedField(
-        queryset=Ingredient.objects.all(), slug_field="id"
+    id = serializers.ReadOnlyField(source="ingredient.id")
+    name = serializers.ReadOnlyField(source="ingredient.name")
+    measurement_unit = serializers.ReadOnlyField(
+        source="ingredient.measurement_unit"
     )
 
     class Meta:
         model = IngredientRecipe
-        fields = ["id", "amount", "recipe"]
-
-
-class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
-    ingredient = serializers.SlugRelatedField(
-        queryset=Ingredient.objects.all(),
-        slug_field="id",
-    )
+        fields = ["id", "name", "measurement_unit", "amount"]
 
-    recipe = serializers.SlugRelatedField(
-        queryset=Recipe.objects.all(), slug_field="id"
-    )
 
-    class Meta:
-        model = IngredientRecipe
-        fields = ["ingredient", "amount", "recipe"]
+class IngredientRecipeWriteSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -73,9 +93,11 @@ class AuthorSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context["request"].user
         if user.is_authenticated:
-            return Subscribe.objects.filter(user=obj, following=user).exists()
+            return Subscribe.objects.filter(user=user, following=obj).exists()
         return False
 
 
@@ -85,6 +107,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     author = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -96,12 +119,15 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
             "author",
         ]
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context["request"].user
         if user.is_authenticated:
             return Favorite.objects.filter(
@@ -110,6 +136,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context["request"].user
         if user.is_authenticated:
             return ShoppingCart.objects.filter(
@@ -124,18 +152,38 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     def get_ingredients(self, obj):
         return IngredientRecipeReadSerializer(
-            instance=obj.ingredients, many=True, context={"recipe": obj}
+            instance=obj.ingredient_recipe.all(), many=True
         ).data
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
-    tags = (
-        serializers.SlugRelatedField(
-            queryset=Tag.objects.all(), many=True, slug_field="id"
-        ),
+class PantryQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
     )
-    ingredients = IngredientRecipeWriteSerializer(many=True, read_only=True)
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    """A matched recipe with how many of its ingredients the pantry has."""
+
+    covered_ingredients = serializers.IntegerField(
+        source="match.covered", read_only=True
+    )
+    missing_ingredients = serializers.IntegerField(
+        source="match.missing", read_only=True
+    )
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + [
+            "covered_ingredients",
+            "missing_ingredients",
+        ]
+
+
+class RecipeWriteSerializer(serializers.ModelSerializer):
+    image = RecipeImageField(max_length=None, use_url=True, required=False)
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = IngredientRecipeWriteSerializer(many=True)
 
     class Meta:
         model = Recipe
@@ -148,6 +196,111 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             "cooking_time",
             "author",
         ]
+        read_only_fields = ["author"]
+
+    def validate_tags(self, value):
+        tags = list(dict.fromkeys(value))
+        if Tag.objects.filter(id__in=tags).count() != len(tags):
+            raise serializers.ValidationError("Unknown tag")
+        return tags
+
+    def validate_ingredients(self, value):
+        ingredients = {item["id"]: item["amount"] for item in value}
+        if len(ingredients) != len(value):
+            raise serializers.ValidationError("Ingredients must not repeat")
+        found = Ingredient.objects.filter(id__in=ingredients).count()
+        if found != len(ingredients):
+            raise serializers.ValidationError("Unknown ingredient")
+        return ingredients
+
+    def validate_image(self, value):
+        return sanitize(value)
+
+    def validate(self, data):
+        if self.instance is None and "image" not in data:
+            raise serializers.ValidationError({"image": "Image is required"})
+        return data
+
+    def create(self, validated_data):
+        tags = validated_data.pop("tags")
+        ingredients = validated_data.pop("ingredients")
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            TagRecipe.objects.bulk_create(
+                TagRecipe(tag_id=tag, recipe=recipe) for tag in tags
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    ingredient_id=ingredient, recipe=recipe, amount=amount
+                )
+                for ingredient, amount in ingredients.items()
+            )
+            index_recipes([recipe.pk])
+            record_change(recipe.pk)
+        generate_variants(recipe.image.name)
+        return recipe
+
+    def update(self, instance, validated_data):
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("ingredients", None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if tags is not None:
+                self.update_tags(instance, tags)
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+                record_change(instance.pk)
+            searched = {"name", "text"}.intersection(validated_data)
+            if ingredients is not None or searched:
+                index_recipes([instance.pk])
+        if "image" in validated_data:
+            generate_variants(instance.image.name)
+        return instance
+
+    @staticmethod
+    def update_tags(recipe, tags):
+        current = set(
+            TagRecipe.objects.filter(recipe=recipe).values_list(
+                "tag_id", flat=True
+            )
+        )
+        removed = current.difference(tags)
+        if removed:
+            TagRecipe.objects.filter(recipe=recipe, tag__in=removed).delete()
+        TagRecipe.objects.bulk_create(
+            TagRecipe(tag_id=tag, recipe=recipe)
+            for tag in tags
+            if tag not in current
+        )
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        current = {
+            item.ingredient_id: item for item in recipe.ingredient_recipe.all()
+        }
+        removed = [
+            item.pk
+            for ingredient, item in current.items()
+            if ingredient not in ingredients
+        ]
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+
+        changed = []
+        for ingredient, amount in ingredients.items():
+            item = current.get(ingredient)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        IngredientRecipe.objects.bulk_update(changed, ["amount"])
+
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                ingredient_id=ingredient, recipe=recipe, amount=amount
+            )
+            for ingredient, amount in ingredients.items()
+            if ingredient not in current
+        )
 
 
 class SubscribeRequestSerializer(serializers.ModelSerializer):
@@ -175,10 +328,61 @@ class SubscribeRequestSerializer(serializers.ModelSerializer):
         raise serializers.ValidationError("Can't sign for yourself")
 
 
+class RecipePreviewSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Recipe
+        fields = [
+            "id",
+            "name",
+            "image",
+            "image_variants",
+            "cooking_time",
+        ]
+
+
+def recipe_previews(authors, limit):
+    """Return the latest ``limit`` recipes of every author in one query."""
+    if not authors:
+        return {}
+    ranked = (
+        Recipe.objects.filter(author__in=authors)
+        .only("id", "author", "name", "image", "cooking_time")
+        .annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=[F("author")],
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        )
+        .order_by()
+    )
+    sql, params = ranked.query.sql_with_params()
+    previews = {author.pk: [] for author in authors}
+    for recipe in Recipe.objects.raw(
+        f"SELECT * FROM ({sql}) ranked WHERE position <= %s "
+        "ORDER BY author_id, position",
+        (*params, limit),
+    ):
+        previews[recipe.author_id].append(recipe)
+    return previews
+
+
+class SubscribeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        authors = list(data)
+        previews = recipe_previews(authors, self.child.recipes_limit)
+        for author in authors:
+            author.recipe_previews = previews[author.pk]
+        return super().to_representation(authors)
+
+
 class SubscribeResponseSerializer(serializers.ModelSerializer):
+    default_recipes_limit = 3
+
     is_subscribed = serializers.SerializerMethodField(read_only=True)
-    recipes = RecipeReadSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
@@ -192,14 +396,31 @@ class SubscribeResponseSerializer(serializers.ModelSerializer):
             "recipes",
             "recipes_count",
         ]
+        list_serializer_class = SubscribeListSerializer
+
+    @property
+    def recipes_limit(self):
+        value = self.context["request"].query_params.get("recipes_limit")
+        if value is not None and value.isdigit():
+            return int(value)
+        return self.default_recipes_limit
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return Subscribe.objects.filter(
             user=self.context["request"].user, following=obj
         ).exists()
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def get_recipes(self, obj):
+        recipes = getattr(obj, "recipe_previews", None)
+        if recipes is None:
+            recipes = obj.recipes.order_by("-pub_date", "-id")[
+                : self.recipes_limit
+            ]
+        return RecipePreviewSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
 
 class FavoriteRequestSerializer(serializers.ModelSerializer):
@@ -248,7 +469,7 @@ class ShoppingCartRequestSerializer(serializers.ModelSerializer):
         fields = "__all__"
         validators = [
             UniqueTogetherValidator(
-                queryset=Favorite.objects.all(), fields=["user", "recipe"]
+                queryset=ShoppingCart.objects.all(), fields=["user", "recipe"]
             )
         ]
 
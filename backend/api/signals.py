@@ -0,0 +1,115 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+from .authentication import invalidate_token, invalidate_user_tokens
+from .cache import invalidate
+from .counters import update_counters
+from .media import add_references, drop_references
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Subscribe, Tag, TagRecipe)
+from .pantry import record_change
+from .search import index_recipes
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Recipe)
+def catalog_changed(sender, **kwargs):
+    invalidate(sender)
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+@receiver([post_save, post_delete], sender=TagRecipe)
+@receiver(m2m_changed, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=TagRecipe)
+def recipe_relation_changed(sender, **kwargs):
+    invalidate(Recipe)
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        index_recipes(
+            IngredientRecipe.objects.filter(ingredient=instance).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    index_recipes([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate(User)
+    invalidate_user_tokens(instance)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Subscribe)
+def user_relation_changed(sender, instance, **kwargs):
+    invalidate(sender, instance.user_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscribe)
+def counted_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscribe)
+def counted_deleted(sender, instance, **kwargs):
+    update_counters(sender, instance, -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_image = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and "image" not in update_fields:
+        return
+    instance._previous_image = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("image", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_image", None)
+    if created or (previous is not None and previous != instance.image.name):
+        drop_references(previous)
+        add_references(instance.image.name)
+
+
+@receiver(post_delete, sender=Recipe)
+def image_deleted(sender, instance, **kwargs):
+    drop_references(instance.image.name)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+HASHED_NAME = re.compile(r"(?:.*/)?([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Names every file after the SHA-256 of its content.
+
+    ``recipes/photo.jpeg`` is stored as ``recipes/3f/3f9a...e1.jpg``, so
+    the same image uploaded twice is written once and both recipes share
+    it. Images get the extension of their format, whatever the upload was
+    called.
+    Shared files are tracked by ``MediaFile`` reference counts and removed
+    by the ``cleanup_media`` command, never on delete.
+    """
+
+    chunk_size = 64 * 1024
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = self.extension(content) or posixpath.splitext(filename)[1]
+        return posixpath.join(
+            directory, digest[:2], digest + extension.lower()
+        )
+
+    @staticmethod
+    def extension(content):
+        """The extension of the image format of ``content``, if known."""
+        from .images import EXTENSIONS
+
+        try:
+            with Image.open(content) as image:
+                image_format = image.format
+        except (OSError, ValueError):
+            return None
+        finally:
+            content.seek(0)
+        return EXTENSIONS.get(image_format, (None,))[0]
+
+    def get_available_name(self, name, max_length=None):
+        # A taken content-addressed name already holds the same content.
+        # FileSystemStorage asks for another name when it loses the race to
+        # create a file, raising stops it from retrying the same name
+        # forever. Upload names are only hashed later, in _save.
+        if HASHED_NAME.fullmatch(name) and self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Refresh the mtime so cleanup_media leaves the file alone while
+            # the new reference to it is being committed.
+            os.utime(self.path(name))
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # An identical upload created the file in the meantime.
+            return name
@@ -0,0 +1,1283 @@
+import base64
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.management.base import SystemCheckError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from users.models import User
+
+from .authentication import local_tokens
+from .autocomplete import reset_index
+from .cache import get_cache, get_stats
+from .checks import check_shared_caches
+from .diagnostics import QueryDiagnosticsMiddleware
+from .factories import (FavoriteFactory, IngredientFactory, RecipeFactory,
+                        ShoppingCartFactory, SubscribeFactory, TagFactory,
+                        UserFactory)
+from .images import reencode, variant_names
+from .metrics import TOTALS, Registry, collect, registry
+from .models import (Favorite, Ingredient, IngredientRecipe, MediaFile, Recipe,
+                     ShoppingCart, Subscribe, Tag, TagRecipe)
+from .pagination import RecipePagination
+from .pantry import get_pantry_index, reset_pantry_index
+from .search import index_recipes
+
+
+class RecipeTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@foodgram.ru",
+            username="reader",
+            first_name="Reader",
+            last_name="Reader",
+            password="pass",
+        )
+        cls.author = User.objects.create_user(
+            email="author@foodgram.ru",
+            username="author",
+            first_name="Author",
+            last_name="Author",
+            password="pass",
+        )
+        cls.tags = [
+            Tag.objects.create(name="Hot", color="#ff0000", slug="hot"),
+            Tag.objects.create(name="Ice", color="#0000ff", slug="ice"),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f"ingredient {i}",
+                                      measurement_unit="g")
+            for i in range(5)
+        ]
+        Subscribe.objects.create(user=cls.user, following=cls.author)
+
+    def create_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=f"recipe {i}",
+                image="recipes/recipe.jpg",
+                text="text",
+                cooking_time=10,
+            )
+            for tag in self.tags:
+                TagRecipe.objects.create(tag=tag, recipe=recipe)
+            for amount, ingredient in enumerate(self.ingredients, start=1):
+                IngredientRecipe.objects.create(
+                    ingredient=ingredient, recipe=recipe, amount=amount
+                )
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+
+class RecipeListQueriesTest(RecipeTestCase):
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, 200)
+        return len(context), response.data
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(1)
+        single, _ = self.count_list_queries()
+        self.create_recipes(8)
+        full, data = self.count_list_queries()
+        self.assertEqual(single, full)
+        self.assertLessEqual(full, 5)
+        self.assertEqual(len(data["results"]), 9)
+
+    def test_list_flags(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(1)
+        _, data = self.count_list_queries()
+        recipe = data["results"][0]
+        self.assertTrue(recipe["is_favorited"])
+        self.assertTrue(recipe["is_in_shopping_cart"])
+        self.assertTrue(recipe["author"]["is_subscribed"])
+        self.assertEqual(
+            [item["amount"] for item in recipe["ingredients"]],
+            [1, 2, 3, 4, 5],
+        )
+        self.assertEqual(len(recipe["tags"]), 2)
+
+    def test_anonymous_list(self):
+        self.create_recipes(2)
+        _, data = self.count_list_queries()
+        recipe = data["results"][0]
+        self.assertFalse(recipe["is_favorited"])
+        self.assertFalse(recipe["is_in_shopping_cart"])
+        self.assertFalse(recipe["author"]["is_subscribed"])
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="buyer@foodgram.ru",
+            username="buyer",
+            first_name="Buyer",
+            last_name="Buyer",
+            password="pass",
+        )
+        salt = Ingredient.objects.create(name="salt", measurement_unit="g")
+        milk = Ingredient.objects.create(name="milk", measurement_unit="ml")
+        for amounts in [(5, 200), (10, 300)]:
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name="recipe",
+                image="recipes/recipe.jpg",
+                text="text",
+                cooking_time=10,
+            )
+            for ingredient, amount in zip([salt, milk], amounts):
+                IngredientRecipe.objects.create(
+                    ingredient=ingredient, recipe=recipe, amount=amount
+                )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_download_sums_amounts(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/recipes/download_shopping_cart/")
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(context), 1)
+        self.assertEqual(
+            content, "milk - 500 ml\nsalt - 15 g\n\nFoodgram, 07/2021"
+        )
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="wishlist.txt"',
+        )
+
+    def test_download_formats(self):
+        self.client.force_authenticate(self.user)
+        url = "/api/recipes/download_shopping_cart/"
+        response = self.client.get(url, {"format": "csv"})
+        self.assertEqual(
+            b"".join(response.streaming_content).decode(),
+            "name,amount,measurement_unit\r\nmilk,500,ml\r\nsalt,15,g\r\n",
+        )
+        response = self.client.get(url, {"format": "json"})
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            [
+                {"name": "milk", "amount": 500, "measurement_unit": "ml"},
+                {"name": "salt", "amount": 15, "measurement_unit": "g"},
+            ],
+        )
+        response = self.client.get(url, {"format": "pdf"})
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        content = b"".join(response.streaming_content)
+        self.assertTrue(content.startswith(b"%PDF-1.4"))
+        self.assertIn(b"(milk - 500 ml) Tj", content)
+        self.assertTrue(content.endswith(b"%%EOF\n"))
+
+
+class IngredientSearchTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ["сок", "абрикосовый сок", "Сокэ", "молоко"]:
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        get_cache().clear()
+        reset_index()
+
+    def test_prefix_hits_go_first(self):
+        response = self.client.get("/api/ingredients/", {"name": "СОК"})
+        self.assertEqual(
+            [item["name"] for item in response.json()],
+            ["сок", "Сокэ", "абрикосовый сок"],
+        )
+
+    def test_search_does_not_query_database(self):
+        self.client.get("/api/ingredients/", {"name": "мол"})
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/ingredients/", {"name": "мол"})
+        self.assertEqual(response.json()[0]["name"], "молоко")
+
+    def test_list_is_cached(self):
+        for params in [{}, {"name": "сок"}]:
+            response = self.client.get("/api/ingredients/", params)
+            self.assertEqual(response["X-Cache"], "MISS")
+            with self.assertNumQueries(0):
+                response = self.client.get("/api/ingredients/", params)
+            self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(json.loads(response.content)), 3)
+
+    def test_not_modified(self):
+        response = self.client.get("/api/ingredients/", {"name": "сок"})
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/ingredients/",
+                {"name": "сок"},
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_index_is_rebuilt_on_change(self):
+        self.client.get("/api/ingredients/", {"name": "мол"})
+        Ingredient.objects.create(name="молоко 3,2%", measurement_unit="мл")
+        response = self.client.get("/api/ingredients/", {"name": "мол"})
+        self.assertEqual(len(response.json()), 2)
+
+
+class CatalogCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name="Hot", color="#ff0000", slug="hot")
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_tags_are_cached_until_changed(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/tags/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+        Tag.objects.create(name="Ice", color="#0000ff", slug="ice")
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertEqual(get_stats(), {"hits": 1, "misses": 2})
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        with self.assertRaises(SystemCheckError):
+            call_command("check", deploy=True, fail_level="ERROR")
+        shared = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.memcached."
+                "MemcachedCache",
+                "LOCATION": "memcached:11211",
+            }
+        }
+        with self.settings(CACHES=shared):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+class ConditionalGetTest(RecipeTestCase):
+    def test_not_modified(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(2)
+        response = self.client.get("/api/recipes/")
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/recipes/", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_the_etag_validates(self):
+        self.create_recipes(1)
+        last_modified = self.client.get("/api/recipes/")["Last-Modified"]
+        # A change within the same second keeps the Last-Modified value.
+        Tag.objects.create(name="New", color="#00ff00", slug="new")
+        response = self.client.get(
+            "/api/recipes/", HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user_and_user_data(self):
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        url = f"/api/recipes/{recipe.pk}/"
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)["ETag"]
+
+        self.client.force_authenticate(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_authenticate(self.user)
+        Favorite.objects.filter(user=self.user).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["is_favorited"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteTest(RecipeTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients += [
+            Ingredient.objects.create(name=f"spice {i}", measurement_unit="g")
+            for i in range(25)
+        ]
+
+    @staticmethod
+    def image():
+        buffer = io.BytesIO()
+        Image.new("RGB", (2, 2)).save(buffer, "PNG")
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/png;base64,{encoded}"
+
+    def payload(self, ingredients):
+        return {
+            "name": "recipe",
+            "text": "text",
+            "cooking_time": 5,
+            "image": self.image(),
+            "tags": [tag.pk for tag in self.tags],
+            "ingredients": [
+                {"id": ingredient.pk, "amount": amount}
+                for amount, ingredient in enumerate(ingredients, start=1)
+            ],
+        }
+
+    def create_recipe(self, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                "/api/recipes/", self.payload(ingredients), format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(context), response.data
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        self.client.force_authenticate(self.author)
+        # The first upload of the image also creates its MediaFile row.
+        self.create_recipe(self.ingredients[:1])
+        single, _ = self.create_recipe(self.ingredients[:1])
+        full, data = self.create_recipe(self.ingredients)
+        self.assertEqual(single, full)
+        self.assertLessEqual(full, 15)
+        self.assertEqual(len(data["ingredients"]), 30)
+        self.assertEqual(len(data["tags"]), 2)
+        self.assertEqual(data["author"]["id"], self.author.pk)
+
+    def test_create_rejects_unknown_ingredient(self):
+        self.client.force_authenticate(self.author)
+        payload = self.payload(self.ingredients[:1])
+        payload["ingredients"].append({"id": 0, "amount": 1})
+        response = self.client.post("/api/recipes/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def search(self, query):
+        response = self.client.get("/api/recipes/", {"search": query})
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_search_follows_writes_and_ranks_names_first(self):
+        self.client.force_authenticate(self.author)
+        recipes = []
+        for name, text, ingredient in [
+            ("Борщ", "На говяжьем бульоне", self.ingredients[0]),
+            ("Салат", "Подавать после борща", self.ingredients[1]),
+            ("Каша", "На молоке", self.ingredients[6]),
+        ]:
+            payload = self.payload([ingredient])
+            payload.update(name=name, text=text)
+            response = self.client.post(
+                "/api/recipes/", payload, format="json"
+            )
+            recipes.append(response.data["id"])
+        borscht, salad, porridge = recipes
+
+        self.assertEqual(self.search("борщ"), [borscht, salad])
+        self.assertEqual(self.search("spice"), [porridge])
+        self.assertEqual(self.search("каша молоке"), [porridge])
+        self.assertEqual(self.search("?!"), [])
+
+        self.client.patch(
+            f"/api/recipes/{porridge}/", {"name": "Борщ"}, format="json"
+        )
+        self.assertEqual(set(self.search("борщ")), set(recipes))
+        self.client.delete(f"/api/recipes/{borscht}/")
+        self.assertNotIn(borscht, self.search("борщ"))
+
+    def test_update_applies_only_the_difference(self):
+        self.client.force_authenticate(self.author)
+        _, data = self.create_recipe(self.ingredients[:3])
+        recipe = Recipe.objects.get(pk=data["id"])
+        kept = IngredientRecipe.objects.get(
+            recipe=recipe, ingredient=self.ingredients[0]
+        )
+        payload = self.payload(self.ingredients[:1])
+        payload["ingredients"] += [
+            {"id": self.ingredients[1].pk, "amount": 20},
+            {"id": self.ingredients[3].pk, "amount": 4},
+        ]
+        payload["tags"] = [self.tags[0].pk]
+        del payload["image"]
+        response = self.client.put(
+            f"/api/recipes/{recipe.pk}/", payload, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        amounts = {
+            item["id"]: item["amount"] for item in response.data["ingredients"]
+        }
+        self.assertEqual(
+            amounts,
+            {
+                self.ingredients[0].pk: 1,
+                self.ingredients[1].pk: 20,
+                self.ingredients[3].pk: 4,
+            },
+        )
+        self.assertEqual(len(response.data["tags"]), 1)
+        self.assertTrue(IngredientRecipe.objects.filter(pk=kept.pk).exists())
+
+    def test_partial_update_keeps_relations(self):
+        self.client.force_authenticate(self.author)
+        _, data = self.create_recipe(self.ingredients[:3])
+        response = self.client.patch(
+            f"/api/recipes/{data['id']}/", {"name": "renamed"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["name"], "renamed")
+        self.assertEqual(len(response.data["ingredients"]), 3)
+        self.assertEqual(len(response.data["tags"]), 2)
+
+    def test_image_is_reencoded_with_variants(self):
+        self.client.force_authenticate(self.author)
+        exif = Image.Exif()
+        exif[0x010E] = "secret"
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(
+            buffer, "JPEG", exif=exif.tobytes()
+        )
+        payload = self.payload(self.ingredients[:1])
+        payload["image"] = "data:image/jpeg;base64," + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
+        response = self.client.post("/api/recipes/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (1600, 800))
+            self.assertFalse(image.getexif())
+        variants = response.data["image_variants"]
+        self.assertEqual(set(variants), {"small", "medium"})
+        self.assertTrue(variants["small"]["webp"].endswith(".small.webp"))
+        for variant, names in variant_names(recipe.image.name).items():
+            for name in names.values():
+                self.assertTrue(default_storage.exists(name), name)
+
+        small = variant_names(recipe.image.name)["small"]["jpeg"]
+        default_storage.delete(small)
+        call_command("process_images", workers=1, stdout=io.StringIO())
+        with default_storage.open(small) as source:
+            self.assertEqual(Image.open(source).size, (320, 160))
+
+    def test_reencoded_image_is_named_after_its_format(self):
+        self.client.force_authenticate(self.author)
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 30), "green").save(buffer, "GIF")
+        payload = self.payload(self.ingredients[:1])
+        payload["image"] = "data:image/gif;base64," + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
+        response = self.client.post("/api/recipes/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        self.assertTrue(recipe.image.name.endswith(".png"))
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.format, "PNG")
+
+    def test_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(
+            buffer, "JPEG", exif=exif.tobytes()
+        )
+        content, image_format = reencode(buffer)
+        self.assertEqual(image_format, "JPEG")
+        with Image.open(io.BytesIO(content)) as image:
+            self.assertEqual(image.size, (800, 1600))
+
+    def test_processed_images_are_not_reencoded_again(self):
+        self.client.force_authenticate(self.author)
+        _, data = self.create_recipe(self.ingredients[:1])
+        uploaded = Recipe.objects.get(pk=data["id"])
+        storage = uploaded.image.storage
+        path = storage.path("recipes/legacy.jpg")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.effect_noise((100, 100), 64).convert("RGB").save(path, "JPEG")
+        legacy = Recipe.objects.create(
+            author=self.author,
+            name="legacy",
+            image="recipes/legacy.jpg",
+            text="text",
+            cooking_time=10,
+        )
+
+        url = f"/api/recipes/{legacy.pk}/"
+        etag = self.client.get(url)["ETag"]
+        call_command("process_images", workers=1, stdout=io.StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        legacy.refresh_from_db()
+        self.assertNotEqual(legacy.image.name, "recipes/legacy.jpg")
+        self.assertTrue(response.data["image"].endswith(legacy.image.name))
+        self.assertEqual(
+            Recipe.objects.get(pk=uploaded.pk).image.name, uploaded.image.name
+        )
+        processed = legacy.image.name
+        etag = self.client.get(url)["ETag"]
+        call_command("process_images", workers=1, stdout=io.StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.image.name, processed)
+
+    def multipart(self, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "blue").save(buffer, "PNG")
+        upload = io.BytesIO(buffer.getvalue())
+        upload.name = "photo.png"
+        return {
+            "name": "recipe",
+            "text": "text",
+            "cooking_time": 5,
+            "image": upload,
+            "tags": [tag.pk for tag in self.tags],
+            "ingredients[0]id": self.ingredients[0].pk,
+            "ingredients[0]amount": 3,
+        }
+
+    def test_create_accepts_multipart_upload(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            "/api/recipes/", self.multipart((40, 30)), format="multipart"
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data["tags"]), 2)
+        self.assertEqual(response.data["ingredients"][0]["amount"], 3)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (40, 30))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024)
+    def test_upload_over_the_limit_is_rejected(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            "/api/recipes/", self.multipart((400, 400)), format="multipart"
+        )
+        self.assertEqual(response.status_code, 413)
+        payload = self.payload(self.ingredients[:1])
+        payload["image"] = "A" * 2048
+        response = self.client.post("/api/recipes/", payload, format="json")
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_identical_images_are_stored_once(self):
+        self.client.force_authenticate(self.author)
+        _, first = self.create_recipe(self.ingredients[:1])
+        _, second = self.create_recipe(self.ingredients[:1])
+        self.assertEqual(first["image"], second["image"])
+        name = Recipe.objects.get(pk=first["id"]).image.name
+        self.assertEqual(MediaFile.objects.get(name=name).references, 2)
+
+        self.client.delete(f"/api/recipes/{first['id']}/")
+        self.assertEqual(MediaFile.objects.get(name=name).references, 1)
+        self.client.delete(f"/api/recipes/{second['id']}/")
+        self.assertEqual(MediaFile.objects.get(name=name).references, 0)
+        self.assertTrue(default_storage.exists(name))
+
+        orphan = default_storage.save("recipes/orphan.png", io.BytesIO(b"x"))
+        call_command("cleanup_media", min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(orphan))
+        small = variant_names(name)["small"]["webp"]
+        self.assertFalse(default_storage.exists(small))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_concurrent_identical_uploads(self):
+        storage = Recipe._meta.get_field("image").storage
+        name = storage.save("recipes/first.png", io.BytesIO(b"race"))
+        # The second upload checked before the first created the file.
+        with mock.patch.object(
+            type(storage), "exists", side_effect=[False, True]
+        ):
+            second = storage.save("recipes/second.png", io.BytesIO(b"race"))
+        self.assertEqual(second, name)
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), b"race")
+
+    def test_names_follow_the_image_format(self):
+        storage = Recipe._meta.get_field("image").storage
+        buffer = io.BytesIO()
+        Image.new("RGB", (2, 2)).save(buffer, "JPEG")
+        names = {
+            storage.save(f"recipes/photo{extension}", ContentFile(content))
+            for extension, content in [
+                (".jpg", buffer.getvalue()),
+                (".JPEG", buffer.getvalue()),
+                (".png", buffer.getvalue()),
+            ]
+        }
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().endswith(".jpg"))
+
+    def test_cleanup_keeps_referenced_and_recent_files(self):
+        self.client.force_authenticate(self.author)
+        _, data = self.create_recipe(self.ingredients[:1])
+        name = Recipe.objects.get(pk=data["id"]).image.name
+        recent = default_storage.save("recipes/recent.png", io.BytesIO(b"x"))
+        call_command("cleanup_media", stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(recent))
+        call_command("cleanup_media", min_age=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(
+            default_storage.exists(variant_names(name)["small"]["jpeg"])
+        )
+        self.assertFalse(default_storage.exists(recent))
+
+
+class KeysetPaginationTest(RecipeTestCase):
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            ids += [item["id"] for item in response.data["results"]]
+            url = response.data["next"]
+        return ids
+
+    def test_recipe_cursor_pages(self):
+        self.create_recipes(12)
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+        ids = self.walk("/api/recipes/?cursor=&limit=5")
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.order_by("-id").values_list("id", flat=True)),
+        )
+
+    def test_subscription_cursor_pages(self):
+        self.client.force_authenticate(self.user)
+        for i in range(4):
+            following = User.objects.create_user(
+                email=f"cook{i}@foodgram.ru",
+                username=f"cook{i}",
+                first_name="Cook",
+                last_name="Cook",
+                password="pass",
+            )
+            Subscribe.objects.create(user=self.user, following=following)
+        ids = self.walk("/api/users/subscriptions/?cursor=&limit=2")
+        self.assertEqual(
+            ids,
+            list(
+                Subscribe.objects.filter(user=self.user)
+                .order_by("-id")
+                .values_list("following", flat=True)
+            ),
+        )
+
+    def test_invalid_cursors(self):
+        self.create_recipes(1)
+        self.client.force_authenticate(self.user)
+        for url, position in [
+            ("/api/recipes/", ["nonsense", 1]),
+            ("/api/recipes/", ["2020-01-01T00:00:00+00:00", "x"]),
+            ("/api/recipes/", [None, 1]),
+            ("/api/recipes/", [1]),
+            ("/api/users/subscriptions/", ["x"]),
+            ("/api/users/subscriptions/", [[1]]),
+        ]:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode())
+            response = self.client.get(url, {"cursor": cursor.decode()})
+            self.assertEqual(response.status_code, 404, (url, position))
+
+    @mock.patch.object(RecipePagination, "max_page_size", 2)
+    def test_limit_is_capped(self):
+        self.create_recipes(3)
+        for url in ["/api/recipes/", "/api/recipes/?cursor="]:
+            response = self.client.get(url, {"limit": 100000})
+            self.assertEqual(len(response.data["results"]), 2)
+
+    def test_page_number_approximate_count(self):
+        self.create_recipes(3)
+        response = self.client.get("/api/recipes/?count=approximate&limit=2")
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class QueryPlansTest(RecipeTestCase):
+    def test_endpoints_use_indexes(self):
+        self.create_recipes(3)
+        Subscribe.objects.create(user=self.author, following=self.user)
+        call_command("check_query_plans", stdout=io.StringIO())
+
+
+class CountersTest(RecipeTestCase):
+    def test_counters_follow_changes(self):
+        self.create_recipes(2)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        self.assertEqual(self.author.followers_count, 1)
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.favorites_count, 1)
+
+        Favorite.objects.filter(recipe=recipe).delete()
+        recipe.delete()
+        Subscribe.objects.all().delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        author = User.objects.get(pk=self.author.pk)
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        Favorite.objects.create(user=self.author, recipe=recipe)
+        recipe.name = "renamed"
+        recipe.save()
+        author.first_name = "Renamed"
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, "Renamed")
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "renamed")
+        self.assertEqual(recipe.favorites_count, 2)
+
+    def test_reconcile_fixes_drift(self):
+        self.create_recipes(2)
+        Recipe.objects.update(favorites_count=7)
+        User.objects.update(recipes_count=0, followers_count=3)
+        call_command("reconcile_counters", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(
+            set(Recipe.objects.values_list("favorites_count", flat=True)),
+            {1},
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        self.assertEqual(self.author.followers_count, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 0)
+
+
+class SubscriptionsTest(RecipeTestCase):
+    def test_previews_are_limited_in_one_query(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(5)
+        for i in range(3):
+            following = User.objects.create_user(
+                email=f"cook{i}@foodgram.ru",
+                username=f"cook{i}",
+                first_name="Cook",
+                last_name="Cook",
+                password="pass",
+            )
+            Subscribe.objects.create(user=self.user, following=following)
+            Recipe.objects.create(
+                author=following,
+                name="recipe",
+                image="recipes/recipe.jpg",
+                text="text",
+                cooking_time=10,
+            )
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/users/subscriptions/", {"recipes_limit": 2}
+            )
+        results = {item["id"]: item for item in response.data["results"]}
+        author = results[self.author.pk]
+        self.assertTrue(author["is_subscribed"])
+        self.assertEqual(author["recipes_count"], 5)
+        self.assertEqual(
+            [recipe["id"] for recipe in author["recipes"]],
+            list(
+                self.author.recipes.order_by("-pub_date", "-id").values_list(
+                    "id", flat=True
+                )[:2]
+            ),
+        )
+        self.assertEqual(
+            set(author["recipes"][0]),
+            {"id", "name", "image", "image_variants", "cooking_time"},
+        )
+        self.assertEqual(
+            sorted(len(item["recipes"]) for item in results.values()),
+            [1, 1, 1, 2],
+        )
+
+    def test_no_subscriptions(self):
+        self.client.force_authenticate(self.author)
+        for params in ({}, {"cursor": ""}):
+            response = self.client.get("/api/users/subscriptions/", params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["results"], [])
+
+
+class TagFilterTest(RecipeTestCase):
+    def setUp(self):
+        hot, ice = self.tags
+        self.recipes = {
+            "hot": RecipeFactory(tags=[hot]).pk,
+            "ice": RecipeFactory(tags=[ice]).pk,
+            "both": RecipeFactory(tags=[hot, ice]).pk,
+        }
+
+    def get(self, **params):
+        response = self.client.get("/api/recipes/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def found(self, **params):
+        names = {pk: name for name, pk in self.recipes.items()}
+        return {names[item["id"]] for item in self.get(**params)["results"]}
+
+    def test_any_and_all_modes(self):
+        self.assertEqual(self.found(tags="hot"), {"hot", "both"})
+        self.assertEqual(
+            self.found(tags=["hot", "ice"]), {"hot", "ice", "both"}
+        )
+        self.assertEqual(
+            self.found(tags=["hot", "ice"], tags_mode="all"), {"both"}
+        )
+        self.assertEqual(
+            self.found(tags=["hot", "nope"], tags_mode="all"), set()
+        )
+        response = self.client.get(
+            "/api/recipes/", {"tags": "hot", "tags_mode": "some"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_facets_count_the_filtered_recipes(self):
+        data = self.get(tags="hot", facets="true")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(
+            [(facet["slug"], facet["count"]) for facet in data["facets"]],
+            [("hot", 2), ("ice", 1)],
+        )
+        self.assertNotIn("facets", self.get(tags="hot"))
+
+    def test_facets_with_search(self):
+        Recipe.objects.filter(pk=self.recipes["both"]).update(name="Борщ")
+        index_recipes(self.recipes.values())
+        data = self.get(search="борщ", facets="true")
+        self.assertEqual(
+            [item["id"] for item in data["results"]], [self.recipes["both"]]
+        )
+        self.assertEqual(
+            [(facet["slug"], facet["count"]) for facet in data["facets"]],
+            [("hot", 1), ("ice", 1)],
+        )
+
+
+class PantryTest(RecipeTestCase):
+    def setUp(self):
+        get_cache().clear()
+        reset_pantry_index()
+        ingredients = self.ingredients
+        self.recipes = [
+            RecipeFactory(author=self.author, ingredients=ingredients[:2]),
+            RecipeFactory(author=self.author, ingredients=ingredients[:4]),
+            RecipeFactory(author=self.author, ingredients=ingredients[3:]),
+        ]
+
+    def match(self, ingredients, **params):
+        response = self.client.get(
+            "/api/recipes/pantry/",
+            {
+                "ingredients": [self.ingredients[i].pk for i in ingredients],
+                **params,
+            },
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (
+                item["id"],
+                item["covered_ingredients"],
+                item["missing_ingredients"],
+            )
+            for item in response.data["results"]
+        ]
+
+    def test_recipes_are_ranked_by_coverage(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.assertEqual(
+            self.match([0, 1]), [(first, 2, 0), (second, 2, 2)]
+        )
+        self.assertEqual(self.match([0, 1], max_missing=1), [(first, 2, 0)])
+        self.assertEqual(
+            self.match([0, 1, 2, 3, 4], max_missing=0),
+            [(second, 4, 0), (third, 2, 0), (first, 2, 0)],
+        )
+        response = self.client.get("/api/recipes/pantry/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_changes_in_place(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.match([0])
+        index = get_pantry_index()
+
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f"/api/recipes/{first}/",
+            {
+                "ingredients": [
+                    {"id": ingredient.pk, "amount": 1}
+                    for ingredient in self.ingredients[1:3]
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.delete(f"/api/recipes/{second}/")
+
+        self.assertEqual(self.match([0]), [])
+        self.assertEqual(self.match([1, 2]), [(first, 2, 0)])
+        self.assertIs(get_pantry_index(), index)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SeedTest(RecipeTestCase):
+    def seed(self):
+        call_command(
+            "seed", users=30, recipes=80, seed=7, stdout=io.StringIO()
+        )
+        recipes = Recipe.objects.filter(author__username__startswith="seed7-")
+        return list(
+            recipes.order_by("pk").values_list(
+                "name", "pub_date", "author__username", "favorites_count"
+            )
+        )
+
+    def test_seed_is_deterministic_and_consistent(self):
+        first = self.seed()
+        self.assertEqual(len(first), 80)
+        self.assertEqual(
+            User.objects.filter(username__startswith="seed7-").count(), 30
+        )
+        self.assertTrue(
+            TagRecipe.objects.filter(recipe__name=first[0][0]).exists()
+        )
+        self.assertEqual(
+            sum(
+                User.objects.filter(username__startswith="seed7-")
+                .values_list("recipes_count", flat=True)
+            ),
+            80,
+        )
+        with self.assertRaises(CommandError):
+            self.seed()
+
+        Recipe.objects.filter(author__username__startswith="seed7-").delete()
+        User.objects.filter(username__startswith="seed7-").delete()
+        self.assertEqual(self.seed(), first)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class BenchmarkTest(RecipeTestCase):
+    def benchmark(self, **options):
+        call_command(
+            "benchmark",
+            iterations=2,
+            cold_iterations=1,
+            stdout=io.StringIO(),
+            **options,
+        )
+
+    def test_report_and_regressions(self):
+        self.create_recipes(3)
+        Recipe.objects.create(
+            author=self.author, name="free", text="text", cooking_time=1
+        )
+        report = tempfile.mktemp(suffix=".json")
+        self.benchmark(output=report)
+        with open(report) as output:
+            endpoints = json.load(output)["endpoints"]
+        listing = endpoints["GET recipe-list"]
+        self.assertEqual(listing["warm"]["requests"], 2)
+        self.assertEqual(listing["cold"]["requests"], 1)
+        self.assertGreater(listing["queries"], 0)
+        self.assertGreater(listing["rows"], 0)
+        self.assertGreater(listing["peak_memory"], 0)
+        self.assertIn("POST recipe-list", endpoints)
+        self.assertGreater(endpoints["GET download_shopping_cart"]["rows"], 0)
+        self.assertIn("DELETE favorite", endpoints)
+
+        listing["queries"] = 1
+        with open(report, "w") as output:
+            json.dump({"endpoints": endpoints}, output)
+        with self.assertRaisesRegex(CommandError, "regression"):
+            self.benchmark(compare=report, threshold=100)
+
+
+class QueryBudgetTest(APITestCase):
+    """Each endpoint has a fixed query budget whatever the page holds.
+
+    Every path is requested against a small and a full page of data; the
+    query counts have to match and stay within the budget, so an N+1
+    introduced anywhere in a serializer fails here.
+    """
+
+    sizes = (1, 6)
+    # (method, path, queries allowed)
+    budgets = [
+        ("get", "/api/tags/", 1),
+        ("get", "/api/ingredients/", 1),
+        ("get", "/api/ingredients/?name=ingr", 1),
+        ("get", "/api/recipes/", 5),
+        ("get", "/api/recipes/?cursor=", 4),
+        ("get", "/api/recipes/?tags={tag.slug}", 5),
+        ("get", "/api/recipes/?search=recipe", 5),
+        ("get", "/api/recipes/?tags={tag.slug}&tags_mode=all&facets=true", 6),
+        ("get", "/api/recipes/pantry/?ingredients={ingredient.pk}", 5),
+        ("get", "/api/recipes/?is_favorited=true", 5),
+        ("get", "/api/recipes/?is_in_shopping_cart=true", 5),
+        ("get", "/api/recipes/{recipe.pk}/", 4),
+        ("get", "/api/recipes/download_shopping_cart/", 1),
+        ("get", "/api/users/", 2),
+        ("get", "/api/users/subscriptions/", 3),
+        ("get", "/api/users/subscriptions/?cursor=", 2),
+        ("get", "/api/users/me/", 0),
+        ("get", "/api/users/{author.pk}/", 1),
+        ("delete", "/api/recipes/{recipe.pk}/favorite/", 3),
+        ("get", "/api/recipes/{recipe.pk}/favorite/", 5),
+        ("delete", "/api/recipes/{recipe.pk}/shopping_cart/", 2),
+        ("get", "/api/recipes/{recipe.pk}/shopping_cart/", 4),
+        ("delete", "/api/users/{author.pk}/subscribe/", 3),
+        ("get", "/api/users/{author.pk}/subscribe/", 7),
+    ]
+
+    def populate(self, size):
+        user = UserFactory()
+        tag = TagFactory()
+        ingredients = IngredientFactory.create_batch(3)
+        authors = UserFactory.create_batch(size)
+        recipes = [
+            RecipeFactory(author=author, tags=[tag], ingredients=ingredients)
+            for author in authors
+            for _ in range(2)
+        ]
+        for recipe in recipes:
+            FavoriteFactory(user=user, recipe=recipe)
+            ShoppingCartFactory(user=user, recipe=recipe)
+        for author in authors:
+            SubscribeFactory(user=user, following=author)
+        return {
+            "user": user,
+            "tag": tag,
+            "ingredient": ingredients[0],
+            "author": authors[0],
+            "recipe": recipes[0],
+        }
+
+    def count_queries(self, method, path, objects):
+        self.client.force_authenticate(objects["user"])
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path.format(**objects))
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, path)
+        return len(context)
+
+    def test_query_budgets(self):
+        counts = {}
+        for size in self.sizes:
+            objects = self.populate(size)
+            for method, path, budget in self.budgets:
+                counts.setdefault((method, path), []).append(
+                    self.count_queries(method, path, objects)
+                )
+        for method, path, budget in self.budgets:
+            with self.subTest(method=method, path=path):
+                small, full = counts[(method, path)]
+                self.assertEqual(small, full, "grows with the page size")
+                self.assertLessEqual(full, budget)
+
+
+class InstrumentationTest(RecipeTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        override = override_settings(METRICS_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.directory = directory
+
+    def test_server_timing_and_metrics(self):
+        self.create_recipes(2)
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/recipes/")
+        timing = response["Server-Timing"]
+        for metric in ("db;dur=", "view;dur=", "render;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+        labels = 'endpoint="recipe-list",method="GET",status="200"'
+        series = (
+            f"foodgram_request_queries_count{{{labels}}}",
+            f'foodgram_request_duration_seconds_bucket{{{labels},le="+Inf"}}',
+        )
+        with open(f"{self.directory}/1.json", "w") as worker:
+            json.dump(
+                {
+                    json.dumps(
+                        [
+                            "foodgram_request_queries",
+                            [
+                                ["endpoint", "recipe-list"],
+                                ["method", "GET"],
+                                ["status", 200],
+                            ],
+                        ]
+                    ): {"buckets": [0] * 9, "sum": 0, "count": 5}
+                },
+                worker,
+            )
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            "# TYPE foodgram_request_duration_seconds histogram", metrics
+        )
+        counts = {
+            line.split(" ")[0]: float(line.split(" ")[1])
+            for line in metrics.splitlines()
+            if line.startswith(series)
+        }
+        self.assertGreaterEqual(counts[series[0]], 6)
+        self.assertGreaterEqual(counts[series[1]], 1)
+
+    @mock.patch("api.metrics.atexit.register")
+    def test_exited_workers_are_merged_into_totals(self, register):
+        key = json.dumps(["foodgram_request_queries", [["endpoint", "x"]]])
+        # A pid above the kernel's limit never belongs to a live process.
+        with open(f"{self.directory}/99999999-1.json", "w") as worker:
+            json.dump(
+                {key: {"buckets": [1] + [0] * 8, "sum": 1, "count": 1}},
+                worker,
+            )
+        worker = Registry()
+        worker.observe("foodgram_request_queries", {"endpoint": "x"}, 3)
+        worker.close()
+        register.assert_called_once_with(worker.close)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(["99999999-1.json", "totals.lock", TOTALS]),
+        )
+
+        collect()
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted([registry.filename, "totals.lock", TOTALS]),
+        )
+        with open(f"{self.directory}/{TOTALS}") as totals:
+            self.assertEqual(
+                json.load(totals)[key],
+                {"buckets": [1, 0, 1] + [0] * 6, "sum": 4, "count": 2},
+            )
+
+
+@override_settings(
+    QUERY_DIAGNOSTICS=True,
+    QUERY_DIAGNOSTICS_SAMPLE_RATE=1,
+    QUERY_DIAGNOSTICS_SLOW_MS=10 ** 6,
+)
+class QueryDiagnosticsTest(RecipeTestCase):
+    def favorited(self, request):
+        for recipe in Recipe.objects.all():
+            Favorite.objects.filter(user=self.user, recipe=recipe).exists()
+        return HttpResponse()
+
+    def test_repeated_queries_are_logged_with_stack(self):
+        self.create_recipes(4)
+        middleware = QueryDiagnosticsMiddleware(self.favorited)
+        with self.assertLogs("api.diagnostics", "WARNING") as logs:
+            middleware(RequestFactory().get("/api/recipes/"))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("query repeated 4 times", logs.output[0])
+        self.assertIn("api_favorite", logs.output[0])
+        self.assertIn("in favorited", logs.output[0])
+
+    @override_settings(QUERY_DIAGNOSTICS_SLOW_MS=0)
+    def test_slow_queries_are_logged_with_plan(self):
+        self.create_recipes(1)
+        self.client.force_authenticate(self.user)
+        with self.assertLogs("api.diagnostics", "WARNING") as logs:
+            self.client.get("/api/recipes/")
+        slow = [line for line in logs.output if "slow query" in line]
+        self.assertTrue(slow)
+        self.assertTrue(
+            any("SCAN" in line or "SEARCH" in line for line in slow)
+        )
+
+    @override_settings(QUERY_DIAGNOSTICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_inspected(self):
+        self.create_recipes(4)
+        middleware = QueryDiagnosticsMiddleware(self.favorited)
+        with self.assertRaises(AssertionError):
+            with self.assertLogs("api.diagnostics", "WARNING"):
+                middleware(RequestFactory().get("/api/recipes/"))
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+)
+class CachedTokenAuthenticationTest(RecipeTestCase):
+    def setUp(self):
+        local_tokens.clear()
+        self.user.refresh_from_db()
+        self.user.set_password("old-password")
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def count_me_queries(self, status=200):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.status_code, status)
+        return len(context)
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.count_me_queries(), 1)
+        self.assertEqual(self.count_me_queries(), 0)
+
+    def test_logout_invalidates(self):
+        self.count_me_queries()
+        response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.count_me_queries(status=401)
+
+    def test_password_change_and_deactivation_invalidate(self):
+        self.count_me_queries()
+        response = self.client.post(
+            "/api/users/set_password/",
+            {
+                "current_password": "old-password",
+                "new_password": "n3w-Pa55w0rd",
+            },
+        )
+        self.assertEqual(response.status_code, 204, response.data)
+        self.assertEqual(self.count_me_queries(), 1)
+
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+        self.count_me_queries(status=401)
+
+    @override_settings(TOKEN_CACHE="default")
+    def test_shared_tier_is_used_by_other_processes(self):
+        self.count_me_queries()
+        local_tokens.clear()
+        self.assertEqual(self.count_me_queries(), 0)
+        self.token.delete()
+        local_tokens.clear()
+        self.count_me_queries(status=401)
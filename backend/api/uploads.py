@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Uploaded image is too large"
+    default_code = "upload_too_large"
+
+
+def get_limit():
+    return settings.RECIPE_IMAGE_MAX_SIZE
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Streams every uploaded file to a temporary file on disk.
+
+    Only one chunk is held in memory at a time, and the upload is aborted
+    as soon as the files together go past ``RECIPE_IMAGE_MAX_SIZE``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.limit = get_limit()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.file.close()
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
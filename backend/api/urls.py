@@ -1,9 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from .views import (FavoriteView, IngredientView, RecipeView,
-                    ShoppingCartDownloadView, ShoppingCartView, SubscribeView,
-                    SubscriptionsView, TagView)
+from .views import (CatalogCacheStatsView, FavoriteView, IngredientView,
+                    RecipeView, ShoppingCartDownloadView, ShoppingCartView,
+                    SubscribeView, SubscriptionsView, TagView)
 
 main_router = SimpleRouter()
 main_router.register("tags", TagView)
@@ -32,5 +32,8 @@ urlpatterns = [
         ShoppingCartDownloadView.as_view(),
         name="download_shopping_cart",
     ),
+    path(
+        "cache/stats/", CatalogCacheStatsView.as_view(), name="cache_stats"
+    ),
     path("", include(main_router.urls)),
 ]
@@ -1,69 +1,160 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch, Sum,
+                              Value)
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import (SAFE_METHODS, AllowAny,
+from rest_framework.permissions import (SAFE_METHODS, AllowAny, IsAdminUser,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from .autocomplete import get_index
+from .cache import CatalogCacheMixin, ConditionalGetMixin, get_stats
+from .filters import filter_by_tags, tag_facets
+from .metrics import collect
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Subscribe, Tag, TagRecipe)
+                     ShoppingCart, Subscribe, Tag)
+from .pagination import (PantryPagination, RecipePagination,
+                         SubscriptionPagination)
+from .pantry import get_pantry_index
+from .renderers import (CSVRenderer, JSONRenderer, PDFRenderer,
+                        PlainTextRenderer)
+from .search import rank_recipes, search_recipes
 from .serializers import (FavoriteRequestSerializer,
-                          FavoriteResponseSerializer,
-                          IngredientRecipeCreateSerializer,
-                          IngredientSerializer, RecipeReadSerializer,
-                          RecipeWriteSerializer, ShoppingCartRequestSerializer,
+                          FavoriteResponseSerializer, IngredientSerializer,
+                          PantryQuerySerializer, PantryRecipeSerializer,
+                          RecipeReadSerializer, RecipeWriteSerializer,
+                          ShoppingCartRequestSerializer,
                           ShoppingCartResponseSerializer,
                           SubscribeRequestSerializer,
                           SubscribeResponseSerializer, TagSerializer)
+from .uploads import LimitedUploadHandler
 
 
-class TagView(viewsets.ReadOnlyModelViewSet):
+class TagView(
+    ConditionalGetMixin, CatalogCacheMixin, viewsets.ReadOnlyModelViewSet
+):
+    cache_model = Tag
+    etag_models = [Tag]
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny]
 
 
-class IngredientView(viewsets.ReadOnlyModelViewSet):
+class IngredientView(
+    ConditionalGetMixin, CatalogCacheMixin, viewsets.ReadOnlyModelViewSet
+):
+    cache_model = Ingredient
+    etag_models = [Ingredient]
     queryset = Ingredient.objects.all()
     pagination_class = None
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
+    search_limit = 20
 
-    def get_queryset(self):
-        name = self.request.query_params.get("name")
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            partial(self.cached, self.search), request, *args, **kwargs
+        )
+
+    def search(self, request, *args, **kwargs):
+        index = get_index()
+        name = request.query_params.get("name")
         if name:
-            return Ingredient.objects.filter(name__startswith=name)
-        return Ingredient.objects.all()
+            ingredients = index.search(name, self.search_limit)
+        else:
+            ingredients = index.all()
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
-class RecipeView(viewsets.ModelViewSet):
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            collect(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+class RecipeView(ConditionalGetMixin, viewsets.ModelViewSet):
+    etag_models = [Recipe, Tag, Ingredient, get_user_model()]
+    user_models = [Favorite, ShoppingCart, Subscribe]
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["author", ]
     ordering = "-pub_date"
 
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
-    def list(self, request, *args, **kwargs):
-        queryset = Recipe.objects.all()
+    def get_queryset(self):
+        user = self.request.user
+        authors = get_user_model().objects.all()
+        queryset = Recipe.objects.defer("search_vector").prefetch_related(
+            "tags",
+            Prefetch(
+                "ingredient_recipe",
+                queryset=IngredientRecipe.objects.select_related("ingredient"),
+            ),
+        )
+        if user.is_authenticated:
+            authors = authors.annotate(
+                is_subscribed=Exists(
+                    Subscribe.objects.filter(
+                        user=user, following=OuterRef("pk")
+                    )
+                )
+            )
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef("pk")
+                    )
+                ),
+            )
+        return queryset.prefetch_related(Prefetch("author", queryset=authors))
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != "list":
+            return queryset
 
         tag_slugs = self.request.query_params.getlist("tags")
         if tag_slugs:
-            queryset = queryset.filter(tags__slug__in=tag_slugs).distinct()
+            queryset = filter_by_tags(
+                queryset,
+                tag_slugs,
+                self.request.query_params.get("tags_mode", "any"),
+            )
 
         is_favorited = self.request.query_params.get("is_favorited")
         if is_favorited == "true" and self.request.user.is_authenticated:
@@ -78,64 +169,75 @@ class RecipeView(viewsets.ModelViewSet):
         ):
             queryset = queryset.filter(shopping_card__user=self.request.user)
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        search = self.request.query_params.get("search")
+        if search:
+            queryset = search_recipes(queryset, search)
+        # Facets nest the filtered queryset, ranking has to come after.
+        self.filtered_queryset = queryset
+        if search:
+            queryset = rank_recipes(queryset, search)
+        return queryset
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if (
+            self.action == "list"
+            and self.request.query_params.get("facets") == "true"
+        ):
+            response.data["facets"] = list(
+                tag_facets(self.filtered_queryset)
+            )
+        return response
 
-        serializer = self.get_serializer(
-            self.filter_queryset(queryset), many=True
+    @action(detail=False, pagination_class=PantryPagination)
+    def pantry(self, request, *args, **kwargs):
+        return self.conditional(self.match_pantry, request, *args, **kwargs)
+
+    def match_pantry(self, request, *args, **kwargs):
+        query = PantryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        matches = get_pantry_index().match(
+            query.validated_data["ingredients"],
+            query.validated_data.get("max_missing"),
         )
-        return Response(serializer.data)
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [match.recipe for match in page]
+        )
+        results = []
+        for match in page:
+            # Deleted since the index was refreshed.
+            recipe = recipes.get(match.recipe)
+            if recipe is not None:
+                recipe.match = match
+                results.append(recipe)
+        serializer = PantryRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
-        data = request.data.copy()
-        data["author"] = request.user.id
-        serializer = self.get_serializer(data=data)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        instance = serializer.save()
-        tags = request.data["tags"]
-        if tags:
-            for tag_id in tags:
-                tag = Tag.objects.get(pk=tag_id)
-                TagRecipe.objects.create(tag=tag, recipe=instance)
-
-        ingredient_recipes = request.data["ingredients"]
-        for ingredient in ingredient_recipes:
-            data = {
-                "ingredient": ingredient["id"],
-                "amount": ingredient["amount"],
-                "recipe": instance.pk,
-            }
-            serializer = IngredientRecipeCreateSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-
+        instance = serializer.save(author=request.user)
         serializer = RecipeReadSerializer(
-            instance, context={"request": request}
+            self.get_queryset().get(pk=instance.pk),
+            context={"request": request},
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
-        recipe = Recipe.objects.get(pk=request.data["id"])
-        ingredients = request.data.pop("ingredients")
-        tags = request.data.pop("tags")
-        IngredientRecipe.objects.filter(recipe=recipe).delete()
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=item.get("id"))
-            amount = item.get("amount")
-            recipe_ingredient = IngredientRecipe.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=amount
-            )
-            recipe_ingredient.save()
-        recipe.cooking_time = request.data.pop("cooking_time")
-        recipe.name = request.data.pop("name")
-        recipe.text = request.data.pop("text")
-        if request.data.get("image") is not None:
-            recipe.image = request.data.pop("image")
-        recipe.save()
-        recipe.tags.set(tags)
-        serializer = RecipeReadSerializer(recipe, context={"request": request})
+        partial = kwargs.pop("partial", False)
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        serializer = RecipeReadSerializer(
+            self.get_queryset().get(pk=instance.pk),
+            context={"request": request},
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -165,12 +267,18 @@ class SubscribeView(APIView):
 
 class SubscriptionsView(ReadOnlyModelViewSet):
     serializer_class = SubscribeResponseSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = SubscriptionPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return get_user_model().objects.filter(
-            following__in=self.request.user.follower.all()
+        return (
+            get_user_model()
+            .objects.filter(following__user=self.request.user)
+            .annotate(
+                subscription_id=F("following__id"),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
+            .order_by("-subscription_id")
         )
 
 
@@ -227,37 +335,33 @@ class ShoppingCartView(APIView):
 class ShoppingCartDownloadView(APIView):
     pagination_class = None
     permission_classes = [IsAuthenticated]
+    renderer_classes = [
+        PlainTextRenderer,
+        CSVRenderer,
+        JSONRenderer,
+        PDFRenderer,
+    ]
 
     def get(self, request, *args, **kwargs):
-        shopping_carts = ShoppingCart.objects.filter(
-            user=self.request.user
-        ).all()
-        recipes = []
-        for cart in shopping_carts:
-            recipes.append(cart.recipe)
-
-        ingredient_recipes = []
-        for recipe in recipes:
-            ingredient_recipes_internal = recipe.ingredient_recipe.all()
-            for ingredient_recipe_internal in ingredient_recipes_internal:
-                ingredient_recipes.append(ingredient_recipe_internal)
-
-        ingredients_dict = {}
-        for ingredient_recipe in ingredient_recipes:
-            ingredients_dict[ingredient_recipe.ingredient] = 0
-
-        for ingredient_recipe in ingredient_recipes:
-            ingredients_dict[
-                ingredient_recipe.ingredient
-            ] += ingredient_recipe.amount
-
-        wishlist = []
-        for ingredient, amount in ingredients_dict.items():
-            wishlist.append(
-                f"{ingredient.name} - {amount} {ingredient.measurement_unit}\n"
+        ingredients = (
+            IngredientRecipe.objects.filter(
+                recipe__shopping_card__user=request.user
+            )
+            .values("ingredient")
+            .annotate(total=Sum("amount"))
+            .order_by("ingredient__name", "ingredient")
+            .values_list(
+                "ingredient__name", "total", "ingredient__measurement_unit"
             )
-        wishlist.append("\n")
-        wishlist.append("Foodgram, 07/2021")
-        response = HttpResponse(wishlist, "Content-Type: text/plain")
-        response["Content-Disposition"] = 'attachment; filename="wishlist.txt"'
+        )
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="wishlist.{renderer.format}"'
+        )
         return response
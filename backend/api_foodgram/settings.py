@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.InstrumentationMiddleware",
+    "api.diagnostics.QueryDiagnosticsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -64,6 +67,37 @@ DATABASES = {
     }
 }
 
+# Every worker has to share the cache, `check --deploy` fails on a
+# process-local one. The default only suits a single process.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "foodgram"),
+    }
+}
+
+CATALOG_CACHE = "default"
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "foodgram-metrics")
+)
+METRICS_FLUSH_INTERVAL = 1
+
+TOKEN_CACHE = os.environ.get("TOKEN_CACHE") or None
+TOKEN_CACHE_TTL = 5 * 60
+TOKEN_CACHE_LOCAL_TTL = 10
+TOKEN_CACHE_SIZE = 1024
+
+QUERY_DIAGNOSTICS = os.environ.get("QUERY_DIAGNOSTICS", "") == "1"
+QUERY_DIAGNOSTICS_SAMPLE_RATE = float(
+    os.environ.get("QUERY_DIAGNOSTICS_SAMPLE_RATE", 0.01)
+)
+QUERY_DIAGNOSTICS_REPEAT_THRESHOLD = 3
+QUERY_DIAGNOSTICS_SLOW_MS = 100
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -95,6 +129,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.environ.get("RECIPE_IMAGE_MAX_SIZE", 10 * 1024 * 1024)
+)
+
 AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
@@ -102,7 +140,7 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 9,
@@ -116,5 +154,6 @@ DJOSER = {
     },
     "SERIALIZERS": {
         "user": "users.serializers.UserSerializer",
+        "current_user": "users.serializers.UserSerializer",
     },
 }
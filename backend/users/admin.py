@@ -11,6 +11,8 @@ class UserAdmin(admin.ModelAdmin):
         "email",
         "first_name",
         "last_name",
+        "recipes_count",
+        "followers_count",
     )
     list_filter = ["email", "username"]
 
@@ -2,11 +2,44 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Keeps ``counter_fields`` out of saves of existing rows.
+
+    The counters are only changed by ``F()`` updates in ``api.counters``,
+    so an instance loaded earlier holds stale values that a full save
+    would write back.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(max_length=254, unique=True)
     username = models.CharField(max_length=120, unique=True)
     first_name = models.CharField(max_length=120)
     last_name = models.CharField(max_length=120)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="recipes_count"
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="followers_count"
+    )
+
+    counter_fields = ("recipes_count", "followers_count")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
@@ -20,9 +20,10 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        id = self.instance.id
-        following = User.objects.get(pk=id)
-        return Subscribe.objects.filter(
-            user=user, following=following
-        ).exists()
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        user = self.context["request"].user
+        # Nobody can follow themselves, which also covers /users/me/.
+        if not user.is_authenticated or user.pk == obj.pk:
+            return False
+        return Subscribe.objects.filter(user=user, following=obj).exists()
@@ -0,0 +1,44 @@
+from rest_framework.test import APITestCase
+
+from api.models import Subscribe
+
+from .models import User
+
+
+class UserViewSetTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@foodgram.ru",
+            username="reader",
+            first_name="Reader",
+            last_name="Reader",
+            password="pass",
+        )
+        cls.author = User.objects.create_user(
+            email="author@foodgram.ru",
+            username="author",
+            first_name="Author",
+            last_name="Author",
+            password="pass",
+        )
+        Subscribe.objects.create(user=cls.user, following=cls.author)
+
+    def test_users_are_annotated_with_subscriptions(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/users/")
+        subscribed = {
+            item["id"]: item["is_subscribed"]
+            for item in response.data["results"]
+        }
+        self.assertEqual(
+            subscribed, {self.user.pk: False, self.author.pk: True}
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/users/me/")
+        self.assertFalse(response.data["is_subscribed"])
+
+        self.client.force_authenticate(None)
+        response = self.client.get(f"/api/users/{self.author.pk}/")
+        self.assertFalse(response.data["is_subscribed"])
@@ -1,6 +1,12 @@
 from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from .views import UserViewSet
+
+router = DefaultRouter()
+router.register("users", UserViewSet)
 
 urlpatterns = [
-    path("", include("djoser.urls")),
+    path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken"), name="auth"),
 ]
@@ -0,0 +1,21 @@
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from djoser.views import UserViewSet as BaseUserViewSet
+
+from api.models import Subscribe
+
+
+class UserViewSet(BaseUserViewSet):
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset().order_by("username")
+        if user.is_authenticated:
+            return queryset.annotate(
+                is_subscribed=Exists(
+                    Subscribe.objects.filter(
+                        user=user, following=OuterRef("pk")
+                    )
+                )
+            )
+        return queryset.annotate(
+            is_subscribed=Value(False, output_field=BooleanField())
+        )